@@ -0,0 +1,209 @@
+"""Agregações de despesas feitas direto no SQLite.
+
+Os totais ficam em `expense_monthly_rollup` (user_id, month, category,
+total_cents, count), atualizada na mesma transação de cada escrita em `expenses`. O
+dashboard, a previsão, `/api/summary` e o admin leem só essa tabela, então o
+custo de uma página depende do número de meses/categorias e não do número de
+despesas. `global_monthly_rollup` soma o mesmo por mês para todos os usuários
+(com quantos tiveram gastos no mês) e é mantida junto, para o painel admin.
+Os números do painel que não vêm de despesas (usuários, admins e o total
+previsto) ficam numa linha única de `admin_stats`, atualizada no cadastro, na
+troca de papel e no refresh das previsões.
+"""
+from datetime import datetime
+
+from forecasting import DEFAULT_MODEL, forecast_batch
+
+
+def to_cents(amount):
+    """Convert a decimal amount to integer cents (half away from zero)."""
+    cents = abs(amount) * 100 + 0.5
+    return int(cents) if amount >= 0 else -int(cents)
+
+
+def bump_data_version(conn, user_id):
+    """Mark the user's expense data as changed. The caller commits."""
+    conn.execute(
+        'INSERT INTO data_versions (user_id, version) VALUES (?, 1) '
+        'ON CONFLICT (user_id) DO UPDATE SET version = version + 1',
+        (user_id,))
+
+
+def data_version(conn, user_id):
+    cur = conn.execute('SELECT version FROM data_versions WHERE user_id = ?', (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _month(date_str):
+    return (date_str or '')[:7]
+
+
+def apply_rollup_delta(conn, user_id, date_str, category, cents, count):
+    """Add ``cents``/``count`` to the rollup bucket of one expense.
+
+    Buckets whose count drops to zero are removed so deleted months and
+    categories disappear from the dashboard. The caller commits.
+    """
+    key = (user_id, _month(date_str), category or '')
+    # a new month for this user counts it as active; see the end for removals
+    had_month = count > 0 and _has_month(conn, user_id, key[1])
+    conn.execute(
+        'INSERT INTO expense_monthly_rollup (user_id, month, category, total_cents, count) '
+        'VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT (user_id, month, category) DO UPDATE SET '
+        'total_cents = total_cents + excluded.total_cents, count = count + excluded.count',
+        key + (cents, count))
+    if count < 0:
+        conn.execute(
+            'DELETE FROM expense_monthly_rollup '
+            'WHERE user_id = ? AND month = ? AND category = ? AND count <= 0', key)
+        active = 0 if _has_month(conn, user_id, key[1]) else -1
+    else:
+        active = 0 if had_month else 1
+    conn.execute(
+        'INSERT INTO global_monthly_rollup (month, total_cents, count, active_users) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT (month) DO UPDATE SET total_cents = total_cents + excluded.total_cents, '
+        'count = count + excluded.count, active_users = active_users + excluded.active_users',
+        (key[1], cents, count, active))
+    if count < 0:
+        conn.execute('DELETE FROM global_monthly_rollup WHERE month = ? AND count <= 0', (key[1],))
+
+
+def _has_month(conn, user_id, month):
+    cur = conn.execute('SELECT 1 FROM expense_monthly_rollup WHERE user_id = ? AND month = ? LIMIT 1',
+                       (user_id, month))
+    return cur.fetchone() is not None
+
+
+def rollup_add(conn, user_id, date_str, category, amount):
+    apply_rollup_delta(conn, user_id, date_str, category, to_cents(amount), 1)
+
+
+def rollup_remove(conn, user_id, date_str, category, amount):
+    apply_rollup_delta(conn, user_id, date_str, category, -to_cents(amount), -1)
+
+
+def rebuild_rollup(conn, user_id=None):
+    """Recompute the rollup from ``expenses`` (all users or just one).
+
+    The global rollup is then recomputed from the per-user one, which is
+    much smaller than ``expenses``.
+    """
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    conn.execute(f'DELETE FROM expense_monthly_rollup {where}', params)
+    conn.execute(
+        'INSERT INTO expense_monthly_rollup (user_id, month, category, total_cents, count) '
+        "SELECT user_id, COALESCE(substr(date, 1, 7), ''), COALESCE(category, ''), SUM(amount_cents), COUNT(*) "
+        f'FROM expenses {where} GROUP BY 1, 2, 3', params)
+    conn.execute('DELETE FROM global_monthly_rollup')
+    conn.execute(
+        'INSERT INTO global_monthly_rollup (month, total_cents, count, active_users) '
+        'SELECT month, SUM(total_cents), SUM(count), COUNT(DISTINCT user_id) FROM expense_monthly_rollup '
+        'GROUP BY month')
+    rebuild_admin_stats(conn)
+    conn.commit()
+
+
+def stats_add_user(conn, role):
+    """Count a newly registered user in ``admin_stats``. The caller commits."""
+    conn.execute('UPDATE admin_stats SET user_count = user_count + 1, admin_count = admin_count + ? WHERE id = 1',
+                 (int(role == 'admin'),))
+
+
+def stats_change_role(conn, old_role, new_role):
+    """Move a user between roles in ``admin_stats``. The caller commits."""
+    delta = int(new_role == 'admin') - int(old_role == 'admin')
+    if delta:
+        conn.execute('UPDATE admin_stats SET admin_count = admin_count + ? WHERE id = 1', (delta,))
+
+
+def rebuild_admin_stats(conn):
+    """Recount ``admin_stats`` from ``users`` and ``forecasts`` (for seed scripts and repairs)."""
+    conn.execute(
+        'INSERT OR REPLACE INTO admin_stats (id, user_count, admin_count, projected, forecast_at) '
+        "SELECT 1, (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM users WHERE role = 'admin'), "
+        'COALESCE(SUM(prediction), 0), MAX(computed_at) FROM forecasts')
+
+
+def admin_stats_row(conn):
+    """Return ``(users, admins, projected total, forecast computed_at)``."""
+    row = conn.execute('SELECT user_count, admin_count, projected, forecast_at FROM admin_stats WHERE id = 1').fetchone()
+    return tuple(row) if row else (0, 0, 0.0, None)
+
+
+def monthly_totals(conn, user_id):
+    """Return ``[(month, total), ...]`` ordered by month (``YYYY-MM``)."""
+    cur = conn.execute(
+        'SELECT month, SUM(total_cents) / 100.0 AS total FROM expense_monthly_rollup '
+        'WHERE user_id = ? GROUP BY month ORDER BY month',
+        (user_id,))
+    return [(row['month'], row['total']) for row in cur]
+
+
+def category_averages(conn, user_id):
+    """Return ``{category: average amount}`` rounded to cents."""
+    cur = conn.execute(
+        'SELECT category, SUM(total_cents) / 100.0 / SUM(count) AS avg_amount FROM expense_monthly_rollup '
+        'WHERE user_id = ? GROUP BY category ORDER BY category',
+        (user_id,))
+    return {row['category']: round(row['avg_amount'], 2) for row in cur}
+
+
+def user_total(conn, user_id):
+    cur = conn.execute('SELECT SUM(total_cents) FROM expense_monthly_rollup WHERE user_id = ?', (user_id,))
+    return (cur.fetchone()[0] or 0) / 100.0
+
+
+def global_total(conn):
+    cur = conn.execute('SELECT SUM(total_cents) FROM global_monthly_rollup')
+    return (cur.fetchone()[0] or 0) / 100.0
+
+
+def global_monthly_totals(conn):
+    """Return ``[(month, total, expenses, active users), ...]`` for all users, ordered by month."""
+    cur = conn.execute('SELECT month, total_cents / 100.0, count, active_users FROM global_monthly_rollup '
+                       'ORDER BY month')
+    return [tuple(row) for row in cur]
+
+
+def refresh_forecasts(conn, model=None):
+    """Forecast next month for every user in one pass and store it in ``forecasts``.
+
+    Data versions are read before the rollup so a write racing with the
+    refresh leaves a stale version behind, never a stale prediction marked
+    as fresh. Returns the number of users forecast.
+    """
+    model = model or DEFAULT_MODEL
+    versions = dict(conn.execute('SELECT user_id, version FROM data_versions').fetchall())
+    cur = conn.execute(
+        'SELECT user_id, month, SUM(total_cents) / 100.0 AS total FROM expense_monthly_rollup '
+        'GROUP BY user_id, month ORDER BY user_id, month')
+    user_ids, series = [], []
+    for row in cur:
+        if not user_ids or user_ids[-1] != row['user_id']:
+            user_ids.append(row['user_id'])
+            series.append([])
+        series[-1].append(row['total'])
+
+    predictions = [round(pred, 2) for pred in forecast_batch(series, model=model)]
+    now = datetime.now().isoformat(timespec='seconds')
+    conn.execute('DELETE FROM forecasts')
+    conn.executemany(
+        'INSERT INTO forecasts (user_id, prediction, months, model, data_version, computed_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(uid, pred, len(values), model, versions.get(uid, 0), now)
+         for uid, values, pred in zip(user_ids, series, predictions)])
+    conn.execute('UPDATE admin_stats SET projected = ?, forecast_at = ? WHERE id = 1',
+                 (round(sum(predictions), 2), now if user_ids else None))
+    conn.commit()
+    return len(user_ids)
+
+
+def stored_forecast(conn, user_id, version):
+    """Return the precomputed prediction if it matches ``version``, else None."""
+    cur = conn.execute(
+        'SELECT prediction FROM forecasts WHERE user_id = ? AND data_version = ? AND model = ?',
+        (user_id, version, DEFAULT_MODEL))
+    row = cur.fetchone()
+    return row[0] if row else None
@@ -1,17 +1,39 @@
+import json
 import os
 import sqlite3
-from datetime import datetime, date
-from io import BytesIO
+import time
+from datetime import datetime, date, timedelta
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, g, Response,
+                   abort, before_render_template, make_response, send_from_directory, template_rendered)
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
-import pandas as pd
-from sklearn.linear_model import LinearRegression
 from dotenv import load_dotenv
 from flask_wtf import CSRFProtect
 import functools
-import time
+import hashlib
+import hmac
+import importlib
+
+import click
+
+import assets
+import avatars
+from aggregates import (monthly_totals, category_averages, user_total, global_monthly_totals, rollup_add,
+                        rollup_remove, rebuild_rollup, bump_data_version, data_version, refresh_forecasts, stored_forecast, to_cents,
+                        stats_add_user, stats_change_role, admin_stats_row)
+from cache import LRUCache
+from compress import CompressionMiddleware, parse_levels
+from exports import FORMATS as EXPORT_FORMATS, ExportJobManager, has_rows, stream_export
+from forecasting import forecast
+from hashing import HasherBusy, PasswordHasher, DEFAULT_PBKDF2_ITERATIONS
+from importer import import_records, iter_csv_records, parse_amount, parse_date
+from listing import list_expenses, list_users
+import metrics
+from db import ConnectionPool
+from migrations import migrate, current_version
+from ratelimit import create_rate_limiter
+from scheduler import JobScheduler
 
 load_dotenv()
 
@@ -19,7 +41,9 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Allow overriding the DB path for tests or deployments via env var
 DB_PATH = os.environ.get('FINGEST_DB_PATH') or os.path.join(BASE_DIR, 'database.db')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+EXPORTS_DIR = os.environ.get('FINGEST_EXPORTS_DIR') or os.path.join(BASE_DIR, 'exports')
+AVATAR_DIR = os.environ.get('FINGEST_AVATAR_DIR') or os.path.join(UPLOAD_FOLDER, 'avatars')
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -30,27 +54,91 @@ app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2 MB upload limit
 csrf = CSRFProtect()
 csrf.init_app(app)
 
-# Simple in-memory rate limiter for sensitive endpoints (per-IP)
-_rate_limits = {}
+# Only trust X-Forwarded-For when running behind that many reverse proxies;
+# otherwise clients could pick their own rate-limit key.
+TRUSTED_PROXIES = int(os.environ.get('FINGEST_TRUST_PROXY', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# HTML, JSON, CSV and text assets are compressed on the way out (brotli/zstd
+# only if installed); set FINGEST_COMPRESSION=off when a proxy already does it
+COMPRESSION = os.environ.get('FINGEST_COMPRESSION', 'zstd,br,gzip')
+if COMPRESSION.lower() not in ('', '0', 'off'):
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, encodings=[e.strip() for e in COMPRESSION.split(',')],
+                                         levels=parse_levels(os.environ.get('FINGEST_COMPRESSION_LEVELS')),
+                                         min_size=int(os.environ.get('FINGEST_COMPRESSION_MIN_SIZE', 500)),
+                                         on_finish=metrics.record_compression)
+
+# Rate limiter for sensitive endpoints (per-IP). 'memory' is per process;
+# 'sqlite' shares the counters between worker processes.
+rate_limiter = create_rate_limiter(
+    os.environ.get('FINGEST_RATE_LIMIT_BACKEND', 'memory'),
+    sqlite_path=os.environ.get('FINGEST_RATE_LIMIT_DB') or os.path.splitext(DB_PATH)[0] + '_ratelimit.db',
+    max_keys=int(os.environ.get('FINGEST_RATE_LIMIT_MAX_KEYS', 100_000)))
+
+
+# pbkdf2 runs on a bounded process pool; FINGEST_HASH_WORKERS=0 hashes inline
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get('FINGEST_HASH_WORKERS', min(4, os.cpu_count() or 1))),
+    max_pending=int(os.environ.get('FINGEST_HASH_MAX_PENDING', 32)),
+    iterations=int(os.environ.get('FINGEST_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS)))
+
+
+# Per-request latency, SQL and render timings (see metrics.py); exposed at
+# /metrics and, with FINGEST_SERVER_TIMING=1, as a Server-Timing header.
+SERVER_TIMING = os.environ.get('FINGEST_SERVER_TIMING', '0') == '1'
+METRICS_TOKEN = os.environ.get('FINGEST_METRICS_TOKEN')
+
+
+@app.before_request
+def start_timing():
+    metrics.start_request()
+
+
+@app.after_request
+def finish_timing(response):
+    rule = request.url_rule
+    timings = metrics.finish_request(rule.endpoint if rule else None, request.method, response.status_code)
+    if SERVER_TIMING and timings is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(timings)
+    return response
+
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def _render_finished(sender, template, context, **extra):
+    timings = metrics.current()
+    started = g.pop('render_started', None)
+    if timings is not None and started is not None:
+        timings.add_span('render', time.perf_counter() - started)
+
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    return 'Servidor ocupado. Tente novamente em instantes.', 503, {'Retry-After': '2'}
+
+
+# login attempts per IP every 5 minutes; load tests from a single host raise it
+LOGIN_RATE_LIMIT = int(os.environ.get('FINGEST_LOGIN_RATE_LIMIT', 6))
+
 
 def rate_limit(key_func, limit=5, per=300):
     def decorator(f):
         @functools.wraps(f)
         def wrapped(*args, **kwargs):
-            key = key_func()
-            now = time.time()
-            window = _rate_limits.setdefault(key, [])
-            # drop old
-            window[:] = [t for t in window if now - t < per]
-            if len(window) >= limit:
+            if not rate_limiter.hit(f'{f.__name__}:{key_func()}', limit, per):
                 return 'Too many requests. Try again later.', 429
-            window.append(now)
             return f(*args, **kwargs)
         return wrapped
     return decorator
 
+
 def _remote_addr():
-    return request.headers.get('X-Forwarded-For', request.remote_addr or 'unknown')
+    return request.remote_addr or 'unknown'
 
 
 def admin_required(f):
@@ -64,94 +152,347 @@ def admin_required(f):
     return wrapped
 
 
+db_pool = ConnectionPool(DB_PATH, factory=metrics.InstrumentedConnection)
+export_jobs = ExportJobManager(db_pool, EXPORTS_DIR,
+                               stale_after=int(os.environ.get('FINGEST_EXPORT_JOB_TIMEOUT', 1800)))
+
+
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # one pooled connection per request, returned to the pool on teardown
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
 
 
 def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE,
-        password TEXT,
-        email TEXT,
-        role TEXT,
-        photo TEXT
-    )
-    ''')
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS expenses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        amount REAL,
-        category TEXT,
-        date TEXT,
-        user_id INTEGER,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    ''')
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS settings (
-        user_id INTEGER PRIMARY KEY,
-        monthly_limit REAL,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    ''')
-    conn.commit()
-    conn.close()
+    with app.app_context():
+        return migrate(get_db())
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = init_db()
+    for version, description, seconds in applied:
+        print(f'{version:>3}  {description} ({seconds:.2f}s)')
+    with app.app_context():
+        print(f'Schema na versão {current_version(get_db())}.')
+
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Recompute the monthly rollups (per user and global) from the expenses table."""
+    init_db()
+    with app.app_context():
+        rebuild_rollup(get_db())
+    print('Rollup reconstruído.')
+
+
+@app.cli.command('forecast-all')
+def forecast_all_command():
+    """Precompute next-month forecasts for every user."""
+    init_db()
+    with app.app_context():
+        count = refresh_forecasts(get_db())
+    print(f'Previsões calculadas para {count} usuários.')
+
+
+scheduler = JobScheduler(db_pool)
+
+
+@scheduler.job('refresh_rollups', 'cron', hour=3, minute=0)
+def job_refresh_rollups(conn):
+    rebuild_rollup(conn)
+
+
+@scheduler.job('refresh_forecasts', 'cron', hour=3, minute=15)
+def job_refresh_forecasts(conn):
+    refresh_forecasts(conn)
+
+
+@scheduler.job('vacuum_analyze', 'cron', day_of_week='sun', hour=4, minute=0)
+def job_vacuum_analyze(conn):
+    conn.execute('VACUUM')
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+@scheduler.job('purge_exports', 'interval', hours=1)
+def job_purge_exports(conn):
+    export_jobs.purge()
+
+
+@scheduler.job('purge_avatars', 'cron', hour=4, minute=30)
+def job_purge_avatars(conn):
+    avatar_store.purge_orphans()
+
+
+# rate-limit state lives in each process, so every process purges its own
+@scheduler.job('purge_rate_limits', 'interval', exclusive=False, minutes=10)
+def job_purge_rate_limits(conn):
+    rate_limiter.purge()
+
+
+def start_scheduler():
+    if os.environ.get('FINGEST_SCHEDULER', '1') != '0':
+        scheduler.start()
+
+
+WARM_TEMPLATES = ('base.html', 'login.html', 'dashboard.html')
+# imported lazily by the forecast batch, the xlsx export and avatar uploads
+WARM_MODULES = ('numpy', 'openpyxl', 'PIL.Image')
+
+
+def warm_up():
+    """Load what the first requests and jobs would otherwise pay for.
+
+    Run from a background thread once the server is listening; returns
+    ``{step: seconds}``.
+    """
+    timings = {}
+
+    def step(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            app.logger.exception('warm-up step %s failed', name)
+        timings[name] = time.perf_counter() - start
+
+    step('templates', lambda: [app.jinja_env.get_template(name) for name in WARM_TEMPLATES])
+    step('password_hasher', password_hasher.warm)
+    step('scheduler', start_scheduler)
+    for module in WARM_MODULES:
+        step(module, functools.partial(importlib.import_module, module))
+    return timings
+
+
+def close_connections():
+    # SQLite connections must not cross a fork: the server's master process
+    # drops its own (opened by init_db) before spawning workers
+    db_pool.close_all()
+    rate_limiter.close()
+
+
+def init_worker():
+    """Per-process startup for `server.serve`, run in each worker after the fork."""
+    start_scheduler()
+
+
+def shutdown_worker():
+    scheduler.shutdown()
+    export_jobs.wait()
+    avatar_store.wait()
+    password_hasher.shutdown()
+    close_connections()
+
+
+@app.cli.command('run-job')
+@click.argument('name', type=click.Choice(sorted(scheduler.jobs)))
+def run_job_command(name):
+    """Run a scheduled job immediately."""
+    init_db()
+    ran = scheduler.run(name)
+    print(f'{name}: ' + ('ok' if ran else 'ignorado (outro processo detém o lock)'))
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# user rows by id, shared across requests; profile() and set_role() invalidate
+# their entries, other processes see changes after at most the TTL
+user_cache = LRUCache(maxsize=int(os.environ.get('FINGEST_USER_CACHE_SIZE', 4096)),
+                      ttl=float(os.environ.get('FINGEST_USER_CACHE_TTL', 30)))
+
+
+def load_user(user_id):
+    user = user_cache.get(user_id)
+    if user is None:
+        cur = get_db().execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        user = cur.fetchone()
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):
+    user_cache.pop(user_id)
+    if g.get('current_user') is not None and g.current_user['id'] == user_id:
+        g.pop('current_user')
+
+
+# static files get content-hashed URLs (/assets/style.<hash>.css); the same
+# hashes version the service worker's precache list
+asset_manifest = assets.AssetManifest(app.static_folder)
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+@app.template_global()
+def asset_url(name):
+    hashed = asset_manifest.hashed(name)
+    if hashed is None:
+        return url_for('static', filename=name)
+    return url_for('asset_file', filename=hashed)
+
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    name, digest = assets.split_hashed(filename)
+    current = asset_manifest.digest(name)
+    if current is None:
+        abort(404)
+    if digest == current:
+        response = send_from_directory(app.static_folder, name, max_age=ASSET_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        # a page rendered before a deploy asking for the previous version:
+        # serve what we have, but don't let it be cached under that URL
+        response = send_from_directory(app.static_folder, name, max_age=0)
+        response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/sw.js')
+def service_worker():
+    # served from the root so its scope covers the whole app
+    precache = [asset_url(name) for name in asset_manifest.names()]
+    body = render_template('sw.js', version=asset_manifest.version(), precache=precache)
+    response = Response(body, mimetype='text/javascript')
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# thumbnails are built off the request thread; the cached user row is
+# dropped once the new photo is live
+avatar_store = avatars.AvatarStore(db_pool, AVATAR_DIR, workers=int(os.environ.get('FINGEST_AVATAR_WORKERS', 1)),
+                                   on_change=user_cache.pop, legacy_dir=UPLOAD_FOLDER)
+AVATAR_MAX_AGE = 365 * 24 * 3600
+
+
+@app.template_global()
+def avatar_url(user, size):
+    photo = user['photo'] if user else None
+    if avatars.is_avatar_key(photo):
+        return url_for('avatar_file', name=avatars.filename(photo, avatars.pick_size(size)))
+    if photo:
+        return url_for('static', filename=f'uploads/{photo}')
+    return asset_url('default-avatar.svg')
+
+
+@app.cli.command('generate-avatars')
+def generate_avatars_command():
+    """Convert photos uploaded before thumbnails existed."""
+    init_db()
+    store = avatars.AvatarStore(db_pool, AVATAR_DIR, workers=0, legacy_dir=UPLOAD_FOLDER)
+    with db_pool.connection() as conn:
+        legacy = conn.execute('SELECT id, photo FROM users WHERE photo IS NOT NULL').fetchall()
+    for row in legacy:
+        if avatars.is_avatar_key(row['photo']):
+            continue
+        path = os.path.join(UPLOAD_FOLDER, os.path.basename(row['photo']))
+        try:
+            with open(path, 'rb') as fh:
+                store.submit(row['id'], fh.read())
+            print(f'usuário {row["id"]}: ok')
+        except (OSError, ValueError) as e:
+            print(f'usuário {row["id"]}: {e}')
+    print(f'{store.purge_orphans()} miniaturas órfãs removidas.')
+
+
+@app.route('/avatars/<name>')
+def avatar_file(name):
+    # names are content hashes, so a given URL never changes
+    response = send_from_directory(AVATAR_DIR, name, max_age=AVATAR_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
 def current_user():
     if 'user_id' in session:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],))
-        user = cur.fetchone()
-        conn.close()
-        return user
+        # memoized for the rest of the request
+        if 'current_user' not in g:
+            g.current_user = load_user(session['user_id'])
+        return g.current_user
     return None
 
 
-def predict_next_month(user_id):
-    conn = get_db()
-    df = pd.read_sql_query('SELECT amount, date FROM expenses WHERE user_id = ?', conn, params=(user_id,))
-    conn.close()
-    if df.empty:
-        return 0.0, {}
+# (user_id, data_version) -> (prediction, category averages)
+forecast_cache = LRUCache(maxsize=int(os.environ.get('FINGEST_FORECAST_CACHE_SIZE', 1024)))
 
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.to_period('M')
-    monthly = df.groupby('month')['amount'].sum().reset_index()
-    monthly['month_idx'] = range(len(monthly))
 
-    if len(monthly) < 2:
-        next_pred = float(monthly['amount'].iloc[-1])
+def predict_next_month(user_id, monthly=None):
+    conn = get_db()
+    version = data_version(conn, user_id)
+    key = (user_id, version)
+    cached = forecast_cache.get(key)
+    if cached is not None:
+        return cached
+    # a batch refresh may already have forecast this exact data version
+    prediction = stored_forecast(conn, user_id, version)
+    if prediction is not None:
+        result = prediction, category_averages(conn, user_id)
     else:
-        X = monthly[['month_idx']].values
-        y = monthly['amount'].values
-        model = LinearRegression()
-        model.fit(X, y)
-        next_pred = float(model.predict([[len(monthly)]])[0])
+        result = _fit_next_month(conn, user_id, monthly)
+    forecast_cache.set(key, result)
+    return result
+
+
+def _fit_next_month(conn, user_id, monthly=None):
+    if monthly is None:
+        monthly = monthly_totals(conn, user_id)
+    if not monthly:
+        return 0.0, {}
+
+    next_pred = forecast([total for _, total in monthly])
 
     # média por categoria
-    conn = get_db()
-    cat_df = pd.read_sql_query('SELECT category, amount FROM expenses WHERE user_id = ?', conn, params=(user_id,))
-    conn.close()
-    if cat_df.empty:
-        cat_avg = {}
-    else:
-        cat_avg = cat_df.groupby('category')['amount'].mean().round(2).to_dict()
+    cat_avg = category_averages(conn, user_id)
 
     return round(float(next_pred), 2), cat_avg
 
 
+def data_etag(*parts):
+    """Strong ETag over ``parts`` (user id, data version, ...)."""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def revalidate(response, etag):
+    # per-user responses: browsers may keep them but must ask again each time
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(etag):
+    """A 304 response if the client already has ``etag``, else None."""
+    # weak comparison (RFC 9110): compressed responses carry the W/ form
+    if etag and request.if_none_match.contains_weak(etag):
+        return revalidate(Response(status=304), etag)
+    return None
+
+
+def page_etag(user, version):
+    """ETag for an HTML page whose content is fixed by ``version``, or None if it can't be reused."""
+    if session.get('_flashes'):
+        return None  # the flash must be rendered (and consumed) now
+    # the page embeds a CSRF token that expires; rotate the ETag well before that
+    limit = app.config.get('WTF_CSRF_TIME_LIMIT', 3600) if app.config.get('WTF_CSRF_ENABLED', True) else None
+    csrf_window = int(time.time() // (limit // 2)) if limit else None
+    return data_etag(request.endpoint, user['id'], version, user['username'], user['role'], user['photo'],
+                     session.get('csrf_token'), csrf_window, asset_manifest.version())
+
+
 @app.route('/')
 def index():
     if 'user_id' in session:
@@ -168,32 +509,30 @@ def register():
 
         conn = get_db()
         cur = conn.cursor()
-        cur.execute('SELECT COUNT(*) as c FROM users')
-        count = cur.fetchone()['c']
-        role = 'admin' if count == 0 else 'user'
+        cur.execute('SELECT 1 FROM users LIMIT 1')
+        role = 'user' if cur.fetchone() else 'admin'
 
-        # explicitly set hashing method
-        hashed = generate_password_hash(password, method='pbkdf2:sha256')
+        hashed = password_hasher.hash(password)
         try:
             cur.execute('INSERT INTO users (username, password, email, role) VALUES (?, ?, ?, ?)',
                         (username, hashed, email, role))
+            stats_add_user(conn, role)
             conn.commit()
             user_id = cur.lastrowid
             # default settings
             cur.execute('INSERT OR IGNORE INTO settings (user_id, monthly_limit) VALUES (?, ?)', (user_id, 0.0))
             conn.commit()
-            conn.close()
+            admin_stats_cache.clear()
             flash('Registrado com sucesso. Faça login.', 'success')
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
-            conn.close()
             flash('Nome de usuário já existe.', 'danger')
 
     return render_template('register.html')
 
 
 @app.route('/login', methods=['GET', 'POST'])
-@rate_limit(_remote_addr, limit=6, per=300)
+@rate_limit(_remote_addr, limit=LOGIN_RATE_LIMIT, per=300)
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -202,8 +541,13 @@ def login():
         cur = conn.cursor()
         cur.execute('SELECT * FROM users WHERE username = ?', (username,))
         user = cur.fetchone()
-        conn.close()
-        if user and check_password_hash(user['password'], password):
+        if user and password_hasher.verify(user['password'], password):
+            if password_hasher.needs_rehash(user['password']):
+                # configured cost changed: upgrade the stored hash transparently
+                cur.execute('UPDATE users SET password = ? WHERE id = ?',
+                            (password_hasher.hash(password), user['id']))
+                conn.commit()
+                user_cache.pop(user['id'])
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['role'] = user['role']
@@ -229,7 +573,13 @@ def dashboard():
         return redirect(url_for('login'))
 
     conn = get_db()
-    df = pd.read_sql_query('SELECT amount, category, date FROM expenses WHERE user_id = ?', conn, params=(user['id'],))
+    # answered from the data version alone when the browser's copy is current
+    version = data_version(conn, user['id'])
+    etag = page_etag(user, version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     cur = conn.cursor()
     cur.execute('SELECT monthly_limit FROM settings WHERE user_id = ?', (user['id'],))
     s = cur.fetchone()
@@ -237,21 +587,20 @@ def dashboard():
     # fetch recent expenses
     cur.execute('SELECT id, amount, category, date FROM expenses WHERE user_id = ? ORDER BY date DESC LIMIT 5', (user['id'],))
     recent = cur.fetchall()
-    conn.close()
 
-    chart_labels = []
-    chart_values = []
+    monthly = monthly_totals(conn, user['id'])
+    chart_labels = [month for month, _ in monthly]
+    chart_values = [total for _, total in monthly]
 
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['date'])
-        df['month'] = df['date'].dt.to_period('M')
-        monthly = df.groupby('month')['amount'].sum().reset_index()
-        chart_labels = monthly['month'].astype(str).tolist()
-        chart_values = monthly['amount'].round(2).tolist()
+    with metrics.span('forecast'):
+        prediction, cat_avg = predict_next_month(user['id'], monthly)
 
-    prediction, cat_avg = predict_next_month(user['id'])
-
-    return render_template('dashboard.html', user=user, labels=chart_labels, values=chart_values, prediction=prediction, category_avg=cat_avg, limit=limit, recent=recent)
+    response = make_response(render_template('dashboard.html', user=user, labels=chart_labels, values=chart_values,
+                                             prediction=prediction, category_avg=cat_avg, limit=limit, recent=recent))
+    if not etag:
+        return response  # showed a flash message: not reusable
+    # rendering may have created the session's CSRF token, which is part of the ETag
+    return revalidate(response, page_etag(user, version))
 
 
 @app.route('/add_expense', methods=['GET', 'POST'])
@@ -260,21 +609,97 @@ def add_expense():
     if not user:
         return redirect(url_for('login'))
     if request.method == 'POST':
-        amount = float(request.form['amount'])
+        # same rules as the importer: finite, within MAX_AMOUNT, stored as an ISO date
+        try:
+            amount = parse_amount(request.form.get('amount'))
+            date_str = parse_date(request.form.get('date'))
+        except ValueError as e:
+            flash(f'Dados inválidos: {e}.', 'danger')
+            return redirect(url_for('add_expense'))
         category = request.form['category']
-        date_str = request.form.get('date') or date.today().isoformat()
         conn = get_db()
         cur = conn.cursor()
-        cur.execute('INSERT INTO expenses (amount, category, date, user_id) VALUES (?, ?, ?, ?)',
-                    (amount, category, date_str, user['id']))
+        cur.execute('INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (?, ?, ?, ?)',
+                    (to_cents(amount), category, date_str, user['id']))
+        rollup_add(conn, user['id'], date_str, category, amount)
+        bump_data_version(conn, user['id'])
         conn.commit()
-        conn.close()
         flash('Gasto adicionado.', 'success')
         return redirect(url_for('dashboard'))
 
     return render_template('add_expense.html')
 
 
+@app.route('/import', methods=['GET', 'POST'])
+def import_expenses():
+    user = current_user()
+    if not user:
+        return redirect(url_for('login'))
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Selecione um arquivo CSV.', 'danger')
+            return redirect(url_for('import_expenses'))
+        result = import_records(get_db(), user['id'], iter_csv_records(file.stream)).as_dict()
+        flash(f'{result["inserted"]} gastos importados, {result["error_count"]} linhas com erro.',
+              'success' if not result['error_count'] else 'warning')
+    return render_template('import_expenses.html', result=result)
+
+
+@app.route('/api/expenses/batch', methods=['POST'])
+def api_expenses_batch():
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    payload = request.get_json(silent=True)
+    items = payload.get('expenses') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return jsonify({'error': 'Envie uma lista de despesas em "expenses".'}), 400
+    # JSON "lines" are 1-based positions in the list
+    records = ((idx, item if isinstance(item, dict) else {}) for idx, item in enumerate(items, 1))
+    return jsonify(import_records(get_db(), user['id'], records).as_dict())
+
+
+def _listing_filters():
+    """Parse listing filters from the query string; raises ValueError."""
+    filters = _export_filters()
+    for key in ('min_amount', 'max_amount'):
+        value = request.args.get(key, '').strip()
+        if value:
+            filters[key] = parse_amount(value)
+    return filters
+
+
+@app.route('/api/expenses')
+def api_expenses():
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        rows, next_cursor = list_expenses(get_db(), user['id'], limit=request.args.get('limit', 50, type=int),
+                                          cursor=request.args.get('cursor'), **_listing_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': [dict(r) for r in rows], 'next_cursor': next_cursor})
+
+
+@app.route('/expenses')
+def expenses_page():
+    user = current_user()
+    if not user:
+        return redirect(url_for('login'))
+    try:
+        rows, next_cursor = list_expenses(get_db(), user['id'], cursor=request.args.get('cursor'),
+                                          **_listing_filters())
+    except ValueError:
+        flash('Filtro ou página inválida.', 'danger')
+        return redirect(url_for('expenses_page'))
+    next_args = {k: v for k, v in request.args.items() if k != 'cursor' and v}
+    next_url = url_for('expenses_page', cursor=next_cursor, **next_args) if next_cursor else None
+    return render_template('expenses.html', expenses=rows, next_url=next_url, filters=request.args)
+
+
 @app.route('/settings', methods=['GET', 'POST'])
 def settings():
     user = current_user()
@@ -285,13 +710,13 @@ def settings():
     if request.method == 'POST':
         limit = float(request.form.get('monthly_limit') or 0.0)
         cur.execute('INSERT OR REPLACE INTO settings (user_id, monthly_limit) VALUES (?, ?)', (user['id'], limit))
+        bump_data_version(conn, user['id'])  # the limit is shown by the dashboard and /api/summary
         conn.commit()
         flash('Configurações salvas.', 'success')
 
     cur.execute('SELECT monthly_limit FROM settings WHERE user_id = ?', (user['id'],))
     s = cur.fetchone()
     limit = s['monthly_limit'] if s else 0.0
-    conn.close()
     return render_template('settings.html', limit=limit)
 
 
@@ -310,45 +735,125 @@ def profile():
             flash('Email atualizado.', 'success')
 
         if 'password' in request.form and request.form.get('password'):
-            newpw = generate_password_hash(request.form.get('password'))
+            newpw = password_hasher.hash(request.form.get('password'))
             cur.execute('UPDATE users SET password = ? WHERE id = ?', (newpw, user['id']))
             conn.commit()
             flash('Senha alterada.', 'success')
 
         if 'photo' in request.files:
             file = request.files['photo']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                ext = filename.rsplit('.', 1)[1].lower()
-                saved_name = f'user_{user["id"]}.{ext}'
-                path = os.path.join(app.config['UPLOAD_FOLDER'], saved_name)
-                file.save(path)
-                cur.execute('UPDATE users SET photo = ? WHERE id = ?', (saved_name, user['id']))
-                conn.commit()
-                flash('Foto atualizada.', 'success')
+            if file and allowed_file(secure_filename(file.filename)):
+                try:
+                    avatar_store.submit(user['id'], file.read())
+                    flash('Foto enviada; a nova imagem aparece em instantes.', 'success')
+                except ValueError as e:
+                    flash(f'Foto não atualizada: {e}.', 'danger')
 
-    cur.execute('SELECT * FROM users WHERE id = ?', (user['id'],))
-    refreshed = cur.fetchone()
-    conn.close()
-    return render_template('profile.html', user=refreshed)
+    if request.method == 'POST':
+        invalidate_user(user['id'])
+    return render_template('profile.html', user=current_user())
+
+
+# the expense figures come from global_monthly_rollup (one row per month) and
+# the user counts and projection from the single admin_stats row; the result
+# is still cached briefly since every admin page load renders it
+admin_stats_cache = LRUCache(maxsize=1, ttl=int(os.environ.get('FINGEST_ADMIN_STATS_TTL', 60)))
+ADMIN_STATS_MONTHS = 12
+
+
+def admin_stats(conn):
+    stats = admin_stats_cache.get('stats')
+    if stats is not None:
+        return stats
+    months = global_monthly_totals(conn)
+    active = {month: users for month, _, _, users in months}
+    this_month = date.today().replace(day=1)
+    last_month = (this_month - timedelta(days=1)).strftime('%Y-%m')
+    total_users, admins, projected, forecast_at = admin_stats_row(conn)
+    stats = {
+        'total_users': total_users,
+        'admins': admins,
+        'total_spent': round(sum(total for _, total, _, _ in months), 2),
+        'months': [{'month': m, 'total': round(t, 2), 'expenses': c, 'active_users': u}
+                   for m, t, c, u in months[-ADMIN_STATS_MONTHS:]],
+        'active_users': active.get(this_month.strftime('%Y-%m'), 0),
+        'active_users_last_month': active.get(last_month, 0),
+        'projected': round(projected, 2),
+        'forecast_at': forecast_at,
+        'computed_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    admin_stats_cache.set('stats', stats)
+    return stats
 
 
 @app.route('/admin', methods=['GET'])
 @admin_required
 def admin():
     conn = get_db()
-    cur = conn.cursor()
-    cur.execute('SELECT id, username, email, role, photo FROM users')
-    users = cur.fetchall()
+    filters = {'q': request.args.get('q', '').strip(), 'role': request.args.get('role', '').strip()}
+    try:
+        users, next_cursor = list_users(conn, cursor=request.args.get('cursor'), **filters)
+    except ValueError:
+        flash('Página inválida.', 'danger')
+        return redirect(url_for('admin'))
+    next_args = {k: v for k, v in filters.items() if v}
+    next_url = url_for('admin', cursor=next_cursor, **next_args) if next_cursor else None
+    return render_template('admin_dashboard.html', users=users, next_url=next_url, filters=filters,
+                           stats=admin_stats(conn))
 
-    # estatísticas básicas
-    cur.execute('SELECT COUNT(*) as total_users FROM users')
-    total_users = cur.fetchone()['total_users']
-    cur.execute('SELECT SUM(amount) as total_spent FROM expenses')
-    total_spent = cur.fetchone()['total_spent'] or 0.0
-    conn.close()
 
-    return render_template('admin_dashboard.html', users=users, total_users=total_users, total_spent=round(total_spent, 2))
+@app.route('/api/admin/users')
+@admin_required
+def api_admin_users():
+    try:
+        rows, next_cursor = list_users(get_db(), limit=request.args.get('limit', 50, type=int),
+                                       cursor=request.args.get('cursor'), q=request.args.get('q', '').strip(),
+                                       role=request.args.get('role', '').strip())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': [dict(r) for r in rows], 'next_cursor': next_cursor})
+
+
+@app.route('/api/admin/stats')
+@admin_required
+def api_admin_stats():
+    return jsonify(admin_stats(get_db()))
+
+
+@app.route('/admin/cache_stats')
+@admin_required
+def cache_stats():
+    return jsonify({'forecast': forecast_cache.stats(), 'users': user_cache.stats(),
+                    'admin_stats': admin_stats_cache.stats(), 'password_hasher': password_hasher.stats()})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # scrapers authenticate with FINGEST_METRICS_TOKEN; admins can use their session
+    auth = request.headers.get('Authorization', '')
+    if not (METRICS_TOKEN and hmac.compare_digest(auth, f'Bearer {METRICS_TOKEN}')):
+        user = current_user()
+        if not user or user['role'] != 'admin':
+            abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    return jsonify(scheduler.stats())
+
+
+@app.route('/admin/jobs/<name>/run', methods=['POST'])
+@admin_required
+def admin_run_job(name):
+    if name not in scheduler.jobs:
+        return jsonify({'error': 'Job desconhecido'}), 404
+    try:
+        ran = scheduler.run(name)
+    except Exception as e:
+        return jsonify({'job': name, 'error': repr(e)}), 500
+    return jsonify({'job': name, 'ran': ran, 'metrics': scheduler.metrics[name]})
 
 
 @app.route('/admin/set_role', methods=['POST'])
@@ -363,31 +868,114 @@ def set_role():
         return redirect(url_for('admin'))
 
     conn = get_db()
-    cur = conn.cursor()
-    cur.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, target_id))
+    old = conn.execute('SELECT role FROM users WHERE id = ?', (target_id,)).fetchone()
+    # guarded on the old role so a concurrent change is not counted twice
+    if old and conn.execute('UPDATE users SET role = ? WHERE id = ? AND role = ?',
+                            (new_role, target_id, old['role'])).rowcount:
+        stats_change_role(conn, old['role'], new_role)
     conn.commit()
-    conn.close()
+    invalidate_user(target_id)
+    admin_stats_cache.clear()
     flash('Papel atualizado.', 'success')
     return redirect(url_for('admin'))
 
 
+def _export_filters():
+    """Read and validate the optional export filters from the query string."""
+    filters = {}
+    for key in ('start', 'end'):
+        value = request.args.get(key, '').strip()
+        if value:
+            date.fromisoformat(value)  # ValueError on malformed dates
+            filters[key] = value
+    category = request.args.get('category', '').strip()
+    if category:
+        filters['category'] = category
+    return filters
+
+
 @app.route('/export')
 def export_excel():
     user = current_user()
     if not user:
         return redirect(url_for('login'))
-    conn = get_db()
-    df = pd.read_sql_query('SELECT amount, category, date FROM expenses WHERE user_id = ?', conn, params=(user['id'],))
-    conn.close()
-    if df.empty:
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in EXPORT_FORMATS:
+        flash('Formato de exportação inválido.', 'danger')
+        return redirect(url_for('dashboard'))
+    try:
+        filters = _export_filters()
+    except ValueError:
+        flash('Data inválida no filtro de exportação.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    if request.args.get('mode') == 'async':
+        return _submit_export_job(user, fmt, filters)
+
+    if not has_rows(get_db(), user_id=user['id'], **filters):
         flash('Sem dados para exportar.', 'info')
         return redirect(url_for('dashboard'))
 
-    output = BytesIO()
-    df.to_excel(output, index=False, engine='openpyxl')
-    output.seek(0)
-    filename = f'expenses_user_{user["id"]}.xlsx'
-    return send_file(output, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    filename = f'expenses_user_{user["id"]}.{ext}'
+    body = stream_export(db_pool.connection(), fmt, user_id=user['id'], **filters)
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+def _export_job_json(job):
+    body = {k: job[k] for k in ('id', 'status', 'format', 'size', 'error', 'created_at', 'finished_at')}
+    body['status_url'] = url_for('export_job_status', job_id=job['id'])
+    if job['status'] == 'done':
+        body['download_url'] = url_for('export_job_download', job_id=job['id'])
+    return body
+
+
+def _submit_export_job(user, fmt, filters):
+    # submitting is idempotent: identical requests map to the same job/artifact
+    conn = get_db()
+    if request.args.get('scope') == 'all':
+        if user['role'] != 'admin':
+            return jsonify({'error': 'Forbidden'}), 403
+        filters['user_id'] = None
+        version = conn.execute('SELECT COALESCE(SUM(version), 0) FROM data_versions').fetchone()[0]
+    else:
+        filters['user_id'] = user['id']
+        version = data_version(conn, user['id'])
+    job = export_jobs.submit(conn, user['id'], fmt, filters, version)
+    return jsonify(_export_job_json(job)), 202
+
+
+def _owned_export_job(job_id):
+    user = current_user()
+    if not user:
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    job = export_jobs.get(get_db(), job_id)
+    if not job or (job['owner_id'] != user['id'] and user['role'] != 'admin'):
+        return None, (jsonify({'error': 'Not found'}), 404)
+    return job, None
+
+
+@app.route('/export/jobs/<job_id>')
+def export_job_status(job_id):
+    job, error = _owned_export_job(job_id)
+    if error:
+        return error
+    return jsonify(_export_job_json(job))
+
+
+@app.route('/export/jobs/<job_id>/download')
+def export_job_download(job_id):
+    job, error = _owned_export_job(job_id)
+    if error:
+        return error
+    path = export_jobs.artifact_path(job)
+    if not path:
+        return jsonify(_export_job_json(job)), 409
+    params = json.loads(job['params'])
+    owner = 'all' if params.get('user_id') is None else f'user_{params["user_id"]}'
+    mimetype, ext = EXPORT_FORMATS[job['format']]
+    return send_file(path, as_attachment=True, download_name=f'expenses_{owner}.{ext}', mimetype=mimetype)
 
 
 @app.route('/api/summary')
@@ -396,14 +984,16 @@ def api_summary():
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
     conn = get_db()
+    etag = data_etag('summary', user['id'], data_version(conn, user['id']))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    total = user_total(conn, user['id'])
     cur = conn.cursor()
-    cur.execute('SELECT SUM(amount) as total FROM expenses WHERE user_id = ?', (user['id'],))
-    total = cur.fetchone()['total'] or 0.0
     cur.execute('SELECT monthly_limit FROM settings WHERE user_id = ?', (user['id'],))
     s = cur.fetchone()
     limit = s['monthly_limit'] if s else 0.0
-    conn.close()
-    return jsonify({'total': round(float(total), 2), 'limit': round(float(limit), 2)})
+    return revalidate(jsonify({'total': total, 'limit': round(float(limit), 2)}), etag)
 
 
 @app.route('/expense/<int:expense_id>/edit', methods=['GET', 'POST'])
@@ -417,34 +1007,34 @@ def edit_expense(expense_id):
     cur.execute('SELECT * FROM expenses WHERE id = ?', (expense_id,))
     exp = cur.fetchone()
     if not exp:
-        conn.close()
         flash('Despesa não encontrada.', 'danger')
         return redirect(url_for('dashboard'))
 
     # permission: owner or admin
     if user['role'] != 'admin' and exp['user_id'] != user['id']:
-        conn.close()
         flash('Sem permissão para editar esta despesa.', 'danger')
         return redirect(url_for('dashboard'))
 
     if request.method == 'POST':
         try:
-            amount = float(request.form.get('amount', '0').replace(',', '.'))
-        except ValueError:
-            flash('Valor inválido.', 'danger')
+            amount = parse_amount(request.form.get('amount'))
+            date_str = parse_date(request.form.get('date') or exp['date'])
+        except ValueError as e:
+            flash(f'Dados inválidos: {e}.', 'danger')
             return redirect(url_for('edit_expense', expense_id=expense_id))
         category = request.form.get('category', '').strip()
-        date_str = request.form.get('date', '').strip() or exp['date']
 
-        cur.execute('UPDATE expenses SET amount = ?, category = ?, date = ? WHERE id = ?',
-                (amount, category, date_str, expense_id))
+        cur.execute('UPDATE expenses SET amount_cents = ?, category = ?, date = ? WHERE id = ?',
+                (to_cents(amount), category, date_str, expense_id))
+        # the edit may move the expense to another month/category bucket
+        rollup_remove(conn, exp['user_id'], exp['date'], exp['category'], exp['amount'])
+        rollup_add(conn, exp['user_id'], date_str, category, amount)
+        bump_data_version(conn, exp['user_id'])
         conn.commit()
-        conn.close()
         flash('Despesa atualizada.', 'success')
         return redirect(url_for('dashboard'))
 
     # GET -> render template
-    conn.close()
     return render_template('edit_expense.html', expense=exp)
 
 
@@ -459,18 +1049,17 @@ def delete_expense(expense_id):
     cur.execute('SELECT * FROM expenses WHERE id = ?', (expense_id,))
     exp = cur.fetchone()
     if not exp:
-        conn.close()
         flash('Despesa não encontrada.', 'danger')
         return redirect(url_for('dashboard'))
 
     if user['role'] != 'admin' and exp['user_id'] != user['id']:
-        conn.close()
         flash('Sem permissão para remover esta despesa.', 'danger')
         return redirect(url_for('dashboard'))
 
     cur.execute('DELETE FROM expenses WHERE id = ?', (expense_id,))
+    rollup_remove(conn, exp['user_id'], exp['date'], exp['category'], exp['amount'])
+    bump_data_version(conn, exp['user_id'])
     conn.commit()
-    conn.close()
     flash('Despesa removida.', 'success')
     return redirect(url_for('dashboard'))
 
@@ -478,4 +1067,6 @@ def delete_expense(expense_id):
 if __name__ == '__main__':
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     init_db()
+    start_scheduler()
+    asset_manifest.auto_reload = True  # pick up edits to static/ without a restart
     app.run(debug=True)
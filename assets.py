@@ -0,0 +1,83 @@
+"""URLs versionadas pelo conteúdo para os arquivos de `static/`.
+
+`asset_url('style.css')` vira ``/assets/style.<hash>.css``; como o hash muda
+junto com o arquivo, essas URLs são servidas com cache `immutable` de um
+ano e o service worker pré-carrega exatamente a mesma lista. Uploads de
+usuários não entram no manifesto.
+"""
+import hashlib
+import os
+import re
+
+HASH_LENGTH = 12
+EXCLUDE_DIRS = ('uploads',)
+EXCLUDE_FILES = ('sw.js',)  # legacy worker path; see static/sw.js
+HASHED_RE = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LENGTH)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name, digest):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{digest}{ext}'
+
+
+def split_hashed(name):
+    """``'style.<hash>.css'`` -> ``('style.css', '<hash>')``; ``(name, None)`` if not hashed."""
+    match = HASHED_RE.match(name)
+    if not match:
+        return name, None
+    return match.group('stem') + match.group('ext'), match.group('hash')
+
+
+class AssetManifest:
+    def __init__(self, directory, auto_reload=False):
+        self.directory = directory
+        self.auto_reload = auto_reload
+        self._files = {}  # relative name -> (mtime_ns, size, hash)
+        self.scan()
+
+    def scan(self):
+        files = {}
+        for root, dirs, names in os.walk(self.directory):
+            dirs[:] = sorted(d for d in dirs if not (root == self.directory and d in EXCLUDE_DIRS))
+            for name in sorted(names):
+                rel = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, '/')
+                if rel in EXCLUDE_FILES or name.startswith('.'):
+                    continue
+                files[rel] = self._stat_entry(rel)
+        self._files = files
+
+    def _stat_entry(self, name):
+        path = os.path.join(self.directory, name)
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size, file_hash(path)
+
+    def digest(self, name):
+        entry = self._files.get(name)
+        if entry is None:
+            return None
+        if self.auto_reload:
+            st = os.stat(os.path.join(self.directory, name))
+            if (st.st_mtime_ns, st.st_size) != entry[:2]:
+                entry = self._files[name] = self._stat_entry(name)
+        return entry[2]
+
+    def hashed(self, name):
+        """Versioned file name for ``name``, or None if it is not a known asset."""
+        digest = self.digest(name)
+        return hashed_name(name, digest) if digest else None
+
+    def names(self):
+        return sorted(self._files)
+
+    def version(self):
+        """Digest of the whole manifest; changes whenever any asset does."""
+        payload = '\n'.join(f'{name}:{self.digest(name)}' for name in self.names())
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:HASH_LENGTH]
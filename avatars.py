@@ -0,0 +1,173 @@
+"""Fotos de perfil reduzidas a miniaturas com nome pelo conteúdo.
+
+O upload é decodificado, cortado ao centro e regravado em WebP nos tamanhos
+de `SIZES` numa thread de fundo. Os arquivos se chamam
+``<hash>-<tamanho>.webp`` (hash do arquivo original), então nunca mudam de
+conteúdo e podem ser servidos com cache `immutable`; `users.photo` guarda só
+o hash. Ao trocar de foto os arquivos antigos são apagados se nenhum outro
+usuário os usa, e `purge_orphans` remove o que sobrar.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SIZES = (64, 256)          # navbar (40px) and profile page (120px), with room for 2x screens
+QUALITY = 80
+MAX_PIXELS = 40_000_000    # refuse decompression bombs well before Pillow's own limit
+KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+FILE_RE = re.compile(r'^([0-9a-f]{32})-(\d+)\.webp$')
+
+log = logging.getLogger(__name__)
+
+
+def avatar_key(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def is_avatar_key(photo):
+    return bool(photo and KEY_RE.match(photo))
+
+
+def filename(key, size):
+    return f'{key}-{size}.webp'
+
+
+def pick_size(size):
+    """Smallest stored size that is at least ``size`` pixels."""
+    return next((s for s in SIZES if s >= size), SIZES[-1])
+
+
+def open_image(data):
+    """Open and sanity-check an upload without decoding it; raises ValueError."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError('imagem inválida') from e
+    width, height = image.size
+    if width * height > MAX_PIXELS:
+        raise ValueError('imagem grande demais')
+    return image
+
+
+def make_thumbnails(data):
+    """Return ``{size: webp_bytes}`` for an uploaded image."""
+    from PIL import Image, ImageOps
+
+    image = open_image(data)
+    # JPEG can decode straight at a reduced scale, much cheaper than full size
+    image.draft('RGB', (SIZES[-1] * 2, SIZES[-1] * 2))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    largest = ImageOps.fit(image, (SIZES[-1], SIZES[-1]), Image.LANCZOS)
+    thumbs = {}
+    for size in SIZES:
+        thumb = largest if size == SIZES[-1] else largest.resize((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        thumb.save(out, 'WEBP', quality=QUALITY, method=4)
+        thumbs[size] = out.getvalue()
+    return thumbs
+
+
+class AvatarStore:
+    def __init__(self, pool, directory, workers=1, on_change=None, legacy_dir=None):
+        self.pool = pool
+        self.directory = directory
+        self.legacy_dir = legacy_dir  # where pre-thumbnail uploads (user_<id>.<ext>) live
+        self.on_change = on_change  # called with user_id once the new photo is live
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='avatar') if workers else None
+        self._latest = {}  # user_id -> key of the newest upload
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._futures = set()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def submit(self, user_id, data):
+        """Validate ``data`` now and build the thumbnails in the background; returns the key."""
+        open_image(data)
+        key = avatar_key(data)
+        with self._lock:
+            self._latest[user_id] = key
+        if self._executor is None:
+            self._process(user_id, key, data)
+            return key
+        future = self._executor.submit(self._process, user_id, key, data)
+        self._futures.add(future)
+        future.add_done_callback(self._finished)
+        return key
+
+    def _finished(self, future):
+        self._futures.discard(future)
+        if future.exception() is not None:
+            log.error('avatar processing failed', exc_info=future.exception())
+
+    def _process(self, user_id, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        if not all(os.path.exists(self.path(filename(key, size))) for size in SIZES):
+            for size, body in make_thumbnails(data).items():
+                tmp = self.path(f'.{key}-{size}.{threading.get_ident()}.part')
+                with open(tmp, 'wb') as fh:
+                    fh.write(body)
+                os.replace(tmp, self.path(filename(key, size)))
+        # the key stays in _latest until it is in the database, so
+        # purge_orphans never sees the new files as unused
+        with self._commit_lock:
+            with self._lock:
+                if self._latest.get(user_id) != key:
+                    return  # a newer upload for this user is on its way
+            with self.pool.connection() as conn:
+                row = conn.execute('SELECT photo FROM users WHERE id = ?', (user_id,)).fetchone()
+                old = row['photo'] if row else None
+                conn.execute('UPDATE users SET photo = ? WHERE id = ?', (key, user_id))
+                conn.commit()
+                if old and old != key:
+                    self._discard(conn, old)
+            with self._lock:
+                if self._latest.get(user_id) == key:
+                    del self._latest[user_id]
+        if self.on_change:
+            self.on_change(user_id)
+
+    def _discard(self, conn, photo):
+        if conn.execute('SELECT 1 FROM users WHERE photo = ? LIMIT 1', (photo,)).fetchone():
+            return
+        if is_avatar_key(photo):
+            paths = [self.path(filename(photo, size)) for size in SIZES]
+        elif self.legacy_dir:
+            paths = [os.path.join(self.legacy_dir, os.path.basename(photo))]
+        else:
+            paths = []
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def purge_orphans(self):
+        """Delete thumbnails no user points to; returns how many files were removed."""
+        if not os.path.isdir(self.directory):
+            return 0
+        # in-flight keys first: a job leaves _latest only after its commit
+        with self._lock:
+            used = set(self._latest.values())
+        with self.pool.connection() as conn:
+            used.update(row['photo'] for row in conn.execute('SELECT photo FROM users WHERE photo IS NOT NULL'))
+        removed = 0
+        for name in os.listdir(self.directory):
+            match = FILE_RE.match(name)
+            if match and match.group(1) not in used:
+                os.remove(self.path(name))
+                removed += 1
+        return removed
+
+    def wait(self):
+        for future in list(self._futures):
+            future.result()
@@ -0,0 +1,51 @@
+"""Benchmark do custo por verificação dos backends de rate limit.
+
+Simula muitos clientes distintos (IPs) batendo no limitador e mede o tempo
+médio de `hit()` para cada backend, além do número de chaves retidas.
+
+Uso:
+  python benchmarks/bench_ratelimit.py --clients 100000 --hits 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import MemoryRateLimiter, SQLiteRateLimiter  # noqa: E402
+
+
+def run(limiter, clients, hits, seed=0):
+    rnd = random.Random(seed)
+    keys = [f'login:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}' for i in range(clients)]
+    start = time.perf_counter()
+    for _ in range(hits):
+        limiter.hit(rnd.choice(keys), 6, 300)
+    elapsed = time.perf_counter() - start
+    return elapsed / hits * 1e6, len(limiter)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--clients', type=int, default=100_000)
+    p.add_argument('--hits', type=int, default=200_000)
+    p.add_argument('--sqlite-hits', type=int, default=20_000, help='hits para o backend SQLite (mais lento)')
+    p.add_argument('--max-keys', type=int, default=50_000)
+    args = p.parse_args()
+
+    print(f'{"backend":<10} {"clientes":>9} {"hits":>8} {"us/hit":>8} {"chaves":>8}')
+    per_hit, keys = run(MemoryRateLimiter(max_keys=args.max_keys), args.clients, args.hits)
+    print(f'{"memory":<10} {args.clients:>9} {args.hits:>8} {per_hit:>8.2f} {keys:>8}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = SQLiteRateLimiter(os.path.join(tmp, 'ratelimit.db'))
+        per_hit, keys = run(limiter, args.clients, args.sqlite_hits)
+        limiter.pool.close_all()
+    print(f'{"sqlite":<10} {args.clients:>9} {args.sqlite_hits:>8} {per_hit:>8.2f} {keys:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""Teste de carga HTTP para o Fingest.
+
+Abre `--sessions` sessões concorrentes (uma thread cada), faz login com os
+usuários gerados por `seed_data.py` (tratando o token CSRF como os smoke
+tests) e, por `--duration` segundos, sorteia cenários conforme `--mix`:
+
+- `dashboard`: GET /dashboard
+- `summary`: GET /api/summary
+- `add_expense`: POST /add_expense
+- `export`: GET /export?format=csv (corpo lido até o fim)
+
+O relatório (vazão, latência p50/p95/p99 e bytes recebidos por cenário —
+como vieram pela rede, antes de descomprimir) é impresso e salvo em JSON;
+`--accept-encoding identity` mede o mesmo sem compressão; `--compare anterior.json` mostra a diferença e termina com código 1 se
+algum p95 piorar ou a vazão cair mais que `--tolerance`.
+
+Uso:
+  python benchmarks/seed_data.py --db bench.db --users 50
+  FINGEST_DB_PATH=bench.db FINGEST_LOGIN_RATE_LIMIT=100000 python run_app.py --serve --port 8000
+  python benchmarks/loadtest.py --url http://127.0.0.1:8000 --sessions 20 --duration 60
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+import requests
+
+USERNAME_FORMAT = 'bench_{:04d}'
+DEFAULT_PASSWORD = 'BenchPass123!'
+DEFAULT_MIX = 'dashboard=40,summary=40,add_expense=15,export=5'
+CATEGORIES = ('food', 'bills', 'transport', 'coffee', 'other')
+
+
+def extract_csrf(text):
+    m = re.search(r'name="csrf_token" value="([^"]+)"', text)
+    return m.group(1) if m else None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f'cenário desconhecido: {name!r}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile (``q`` in 0..100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+class Client:
+    def __init__(self, base_url, username, password, timeout, accept_encoding=None):
+        self.base_url = base_url
+        self.session = requests.Session()
+        if accept_encoding:
+            self.session.headers['Accept-Encoding'] = accept_encoding
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.csrf = None
+
+    def url(self, path):
+        return self.base_url + path
+
+    def login(self):
+        r = self.session.get(self.url('/login'), timeout=self.timeout)
+        data = {'username': self.username, 'password': self.password}
+        token = extract_csrf(r.text)
+        if token:
+            data['csrf_token'] = token
+        r = self.session.post(self.url('/login'), data=data, allow_redirects=False, timeout=self.timeout)
+        if r.status_code != 302 or '/dashboard' not in r.headers.get('Location', ''):
+            raise RuntimeError(f'login de {self.username} falhou: HTTP {r.status_code}')
+        # the CSRF token is tied to the session, so one page load covers every POST
+        self.csrf = extract_csrf(self.session.get(self.url('/add_expense'), timeout=self.timeout).text)
+
+
+def fetch(client, method, path, **kwargs):
+    """Send a request and read the body as it came over the wire (still compressed).
+
+    Returns ``(status, bytes)``; the client never decodes it, so only the
+    server pays for compression.
+    """
+    with client.session.request(method, client.url(path), stream=True, allow_redirects=False,
+                                timeout=client.timeout, **kwargs) as r:
+        size = sum(len(chunk) for chunk in r.raw.stream(64 * 1024, decode_content=False))
+    return r.status_code, size
+
+
+def scenario_dashboard(client, rnd):
+    status, size = fetch(client, 'GET', '/dashboard')
+    return status == 200, status, size
+
+
+def scenario_summary(client, rnd):
+    status, size = fetch(client, 'GET', '/api/summary')
+    return status == 200, status, size
+
+
+def scenario_add_expense(client, rnd):
+    data = {'amount': f'{rnd.randint(100, 20_000) / 100:.2f}', 'category': rnd.choice(CATEGORIES),
+            'date': date.today().isoformat()}
+    if client.csrf:
+        data['csrf_token'] = client.csrf
+    status, size = fetch(client, 'POST', '/add_expense', data=data)
+    return status == 302, status, size
+
+
+def scenario_export(client, rnd):
+    status, size = fetch(client, 'GET', '/export?format=csv')
+    return status == 200, status, size
+
+
+SCENARIOS = {
+    'dashboard': scenario_dashboard,
+    'summary': scenario_summary,
+    'add_expense': scenario_add_expense,
+    'export': scenario_export,
+}
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in SCENARIOS}
+        self.errors = {name: 0 for name in SCENARIOS}
+        self.bytes = {name: 0 for name in SCENARIOS}
+        self.statuses = {}
+
+    def add(self, name, seconds, ok, status, size=0):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.bytes[name] += size
+            if not ok:
+                self.errors[name] += 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+
+def run_session(client, mix, recorder, warmup_until, deadline, seed):
+    rnd = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rnd.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok, status, size = SCENARIOS[name](client, rnd)
+        except requests.RequestException as e:
+            ok, status, size = False, type(e).__name__, 0
+        if start >= warmup_until:
+            recorder.add(name, time.perf_counter() - start, ok, status, size)
+
+
+def summarize(recorder, elapsed):
+    scenarios = {}
+    for name, values in recorder.latencies.items():
+        if not values:
+            continue
+        values = sorted(values)
+        scenarios[name] = {
+            'count': len(values),
+            'errors': recorder.errors[name],
+            'rps': round(len(values) / elapsed, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+            'kb_per_request': round(recorder.bytes[name] / len(values) / 1024, 2),
+        }
+    everything = sorted(v for values in recorder.latencies.values() for v in values)
+    total = {
+        'requests': len(everything),
+        'errors': sum(recorder.errors.values()),
+        'rps': round(len(everything) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round((percentile(everything, 50) or 0) * 1000, 2),
+        'p95_ms': round((percentile(everything, 95) or 0) * 1000, 2),
+        'p99_ms': round((percentile(everything, 99) or 0) * 1000, 2),
+        'kb_per_request': round(sum(recorder.bytes.values()) / len(everything) / 1024, 2) if everything else 0.0,
+        'mb_per_s': round(sum(recorder.bytes.values()) / elapsed / 1024 ** 2, 3) if elapsed else 0.0,
+        'statuses': recorder.statuses,
+    }
+    return total, scenarios
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Print p95/throughput deltas against ``baseline``; returns the list of regressions."""
+    regressions = []
+    print(f'\n{"cenário":<12} {"p95 antes":>10} {"p95 agora":>10} {"Δ":>8} {"rps antes":>10} {"rps agora":>10} {"Δ":>8}')
+    rows = [('total', baseline['total'], report['total'])]
+    rows += [(name, baseline['scenarios'][name], stats) for name, stats in report['scenarios'].items()
+             if name in baseline['scenarios']]
+    for name, old, new in rows:
+        d_p95 = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        d_rps = (new['rps'] - old['rps']) / old['rps'] if old['rps'] else 0.0
+        flag = ''
+        if d_p95 > tolerance or d_rps < -tolerance:
+            regressions.append(name)
+            flag = '  <- regressão'
+        print(f'{name:<12} {old["p95_ms"]:>10.1f} {new["p95_ms"]:>10.1f} {d_p95:>+8.1%} '
+              f'{old["rps"]:>10.1f} {new["rps"]:>10.1f} {d_rps:>+8.1%}{flag}')
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--url', default='http://127.0.0.1:5000', help='Base URL do app')
+    p.add_argument('--sessions', type=int, default=10, help='sessões (usuários) concorrentes')
+    p.add_argument('--users', type=int, default=None,
+                   help='quantos usuários bench_* existem (padrão: um por sessão)')
+    p.add_argument('--password', default=DEFAULT_PASSWORD)
+    p.add_argument('--duration', type=float, default=30.0, help='segundos de medição')
+    p.add_argument('--warmup', type=float, default=3.0, help='segundos iniciais descartados')
+    p.add_argument('--mix', default=DEFAULT_MIX, help='pesos dos cenários, ex. dashboard=1,summary=1')
+    p.add_argument('--timeout', type=float, default=30.0)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--accept-encoding', default=None,
+                   help='Accept-Encoding das sessões (ex. identity, gzip, br); padrão o do requests')
+    p.add_argument('--output', default=None, help='arquivo JSON (padrão benchmarks/results/loadtest-<data>.json)')
+    p.add_argument('--compare', default=None, help='relatório JSON anterior para comparar')
+    p.add_argument('--tolerance', type=float, default=0.10, help='piora relativa tolerada na comparação')
+    args = p.parse_args()
+
+    base_url = args.url.rstrip('/')
+    mix = parse_mix(args.mix)
+    users = args.users or args.sessions
+    clients = [Client(base_url, USERNAME_FORMAT.format(i % users + 1), args.password, args.timeout,
+                      args.accept_encoding) for i in range(args.sessions)]
+    print(f'Login de {len(clients)} sessões...')
+    with ThreadPoolExecutor(max_workers=min(len(clients), 32)) as pool:
+        list(pool.map(Client.login, clients))
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    print(f'Medindo por {args.duration:.0f}s (aquecimento {args.warmup:.0f}s), mix {mix}')
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        futures = [pool.submit(run_session, c, mix, recorder, warmup_until, deadline, args.seed + i)
+                   for i, c in enumerate(clients)]
+        for f in futures:
+            f.result()
+    elapsed = time.perf_counter() - warmup_until
+
+    total, scenarios = summarize(recorder, elapsed)
+    report = {
+        'meta': {
+            'url': base_url,
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'sessions': args.sessions,
+            'users': users,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'mix': mix,
+            'seed': args.seed,
+            'accept_encoding': clients[0].session.headers.get('Accept-Encoding'),
+        },
+        'total': total,
+        'scenarios': scenarios,
+    }
+
+    print(f'\n{"cenário":<12} {"reqs":>7} {"erros":>6} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+          f'{"KB/req":>8}')
+    for name, s in list(scenarios.items()) + [('total', total)]:
+        print(f'{name:<12} {s.get("count", s.get("requests")):>7} {s["errors"]:>6} {s["rps"]:>8.1f} '
+              f'{s["p50_ms"]:>8.1f} {s["p95_ms"]:>8.1f} {s["p99_ms"]:>8.1f} {s["kb_per_request"]:>8.1f}')
+    print(f'Recebido: {total["mb_per_s"]:.3f} MB/s (Accept-Encoding: {report["meta"]["accept_encoding"]})')
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                         f'loadtest-{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f'\nRelatório salvo em {output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Microbenchmarks das funções quentes do app, por tamanho de histórico."""
+import itertools
+
+import pytest
+
+import compress
+from exports import stream_export
+
+HITS_PER_ROUND = 1000
+
+
+def bench_predict_next_month_cold(fingest_app, dataset, bench, size):
+    user_id = dataset(size)
+    with fingest_app.app.app_context():
+        bench(lambda: fingest_app.predict_next_month(user_id), setup=fingest_app.forecast_cache.clear)
+
+
+def bench_dashboard_view(fingest_app, dataset, bench, size):
+    user_id = dataset(size)
+    client = fingest_app.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    def render():
+        assert client.get('/dashboard').status_code == 200
+
+    bench(render)
+
+
+@pytest.mark.parametrize('fmt', ['xlsx', 'csv'])
+def bench_export_serialization(fingest_app, dataset, bench, size, fmt):
+    user_id = dataset(size)
+
+    def export():
+        for _ in stream_export(fingest_app.db_pool.connection(), fmt, user_id=user_id):
+            pass
+
+    bench(export)
+
+
+def bench_rate_limit(fingest_app, bench, size):
+    # `size` distinct client keys; above FINGEST_RATE_LIMIT_MAX_KEYS this is the eviction path
+    fingest_app.rate_limiter.reset()
+    keys = itertools.cycle(range(size))
+    limited = fingest_app.rate_limit(lambda: next(keys), limit=10 ** 9, per=300)(lambda: None)
+    for _ in range(size):
+        limited()
+
+    def hits():
+        for _ in range(HITS_PER_ROUND):
+            limited()
+
+    result = bench(hits)
+    result['per_call_us'] = round(result['median_s'] / HITS_PER_ROUND * 1e6, 3)
+
+
+# the default level of each encoding (compress.DEFAULT_LEVELS) next to its neighbours
+COMPRESSION_LEVELS = [('gzip', 1), ('gzip', 4), ('gzip', 6), ('br', 2), ('br', 4), ('br', 6),
+                      ('zstd', 1), ('zstd', 3), ('zstd', 6)]
+
+
+@pytest.mark.parametrize('page', ['dashboard', 'csv'])
+@pytest.mark.parametrize('encoding,level', COMPRESSION_LEVELS)
+def bench_compression(fingest_app, dataset, bench, size, page, encoding, level):
+    if encoding not in compress.available_encodings():
+        pytest.skip(f'{encoding} não instalado')
+    user_id = dataset(size)
+    if page == 'dashboard':
+        client = fingest_app.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        body = client.get('/dashboard').data
+    else:
+        body = b''.join(stream_export(fingest_app.db_pool.connection(), 'csv', user_id=user_id))
+    chunks = [body[i:i + 64 * 1024] for i in range(0, len(body), 64 * 1024)]  # as streamed
+    out = []
+
+    def run():
+        comp = compress.compressor(encoding, level)
+        out[:] = [comp.compress(chunk) for chunk in chunks] + [comp.flush()]
+
+    result = bench(run)
+    compressed = sum(len(c) for c in out)
+    result['kb_in'] = round(len(body) / 1024, 1)
+    result['ratio'] = round(compressed / len(body), 3)
+    result['mb_per_s'] = round(len(body) / result['median_s'] / 1024 ** 2, 1)
@@ -0,0 +1,169 @@
+"""Infraestrutura dos microbenchmarks (fixture `bench`, dados e baseline).
+
+Como em `tests/test_app.py`, o app é importado com `FINGEST_DB_PATH`
+apontando para um banco temporário. Cada tamanho de `--bench-sizes` vira um
+usuário com esse número de despesas, gerado uma vez por sessão.
+
+    python -m pytest benchmarks/micro --bench-save benchmarks/results/micro-baseline.json
+    python -m pytest benchmarks/micro --bench-compare benchmarks/results/micro-baseline.json
+
+Com `--bench-compare` um benchmark falha se a mediana passar a da baseline
+por mais de `--bench-threshold` (25%).
+"""
+import gc
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+import pytest
+
+DEFAULT_SIZES = '1,100,10000,1000000'
+CATEGORIES = ('food', 'bills', 'transport', 'health', 'leisure', 'education', 'coffee', 'other')
+
+_results = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('fingest microbenchmarks')
+    group.addoption('--bench-sizes', default=DEFAULT_SIZES, help='despesas por usuário, separadas por vírgula')
+    group.addoption('--bench-min-time', type=float, default=0.5, help='segundos mínimos de medição por caso')
+    group.addoption('--bench-max-rounds', type=int, default=1000)
+    group.addoption('--bench-save', metavar='PATH', help='grava os tempos como baseline')
+    group.addoption('--bench-compare', metavar='PATH', help='compara com uma baseline gravada')
+    group.addoption('--bench-threshold', type=float, default=0.25, help='piora relativa tolerada')
+
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        sizes = [int(s) for s in metafunc.config.getoption('bench_sizes').split(',') if s.strip()]
+        metafunc.parametrize('size', sizes)
+
+
+@pytest.fixture(scope='session')
+def fingest_app():
+    os.environ['FINGEST_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['FINGEST_EXPORTS_DIR'] = tempfile.mkdtemp()
+    os.environ['FINGEST_SCHEDULER'] = '0'
+    import app as app_module
+
+    app_module.app.config['WTF_CSRF_ENABLED'] = False
+    app_module.app.config['TESTING'] = True
+    app_module.init_db()
+    return app_module
+
+
+@pytest.fixture(scope='session')
+def dataset(fingest_app):
+    """``dataset(size)`` -> id of a user with ``size`` expenses spread over three years."""
+    from aggregates import bump_data_version, rebuild_rollup
+
+    users = {}
+
+    def make(size):
+        if size in users:
+            return users[size]
+        rnd = random.Random(size)
+        months = [date(2023 + m // 12, m % 12 + 1, 1) for m in range(36)]
+        with fingest_app.db_pool.connection() as conn:
+            user_id = conn.execute('INSERT INTO users (username, password, email, role) VALUES (?, ?, ?, ?)',
+                                   (f'bench_{size}', '', f'bench_{size}@bench.local', 'user')).lastrowid
+            conn.execute('INSERT INTO settings (user_id, monthly_limit) VALUES (?, 3000.0)', (user_id,))
+            rows = ((rnd.randint(100, 50_000), rnd.choice(CATEGORIES),
+                     months[i % len(months)].replace(day=rnd.randint(1, 28)).isoformat(), user_id)
+                    for i in range(size))
+            conn.executemany('INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (?, ?, ?, ?)',
+                             rows)
+            conn.commit()
+            rebuild_rollup(conn, user_id)
+            bump_data_version(conn, user_id)
+            conn.commit()
+        users[size] = user_id
+        return user_id
+
+    return make
+
+
+class Bench:
+    def __init__(self, name, min_time, max_rounds, baseline, threshold):
+        self.name = name
+        self.min_time = min_time
+        self.max_rounds = max_rounds
+        self.baseline = baseline
+        self.threshold = threshold
+
+    def __call__(self, func, setup=None):
+        """Time ``func()`` repeatedly (``setup()`` runs untimed before each call)."""
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()  # warm-up
+        timings = []
+        spent = 0.0
+        if time.perf_counter() - start > self.min_time * 4:
+            # slow cases (1M rows) are measured once, reusing the warm-up round
+            timings.append(time.perf_counter() - start)
+        gc.collect()
+        gc.disable()  # like timeit: keep collector pauses out of the numbers
+        try:
+            while not timings or (len(timings) < self.max_rounds and (spent < self.min_time or len(timings) < 3)
+                                  and timings[-1] <= self.min_time * 4):
+                if setup:
+                    setup()
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+                timings.append(elapsed)
+                spent += elapsed
+        finally:
+            gc.enable()
+        result = {'median_s': statistics.median(timings), 'min_s': min(timings), 'rounds': len(timings)}
+        _results[self.name] = result
+        previous = (self.baseline or {}).get(self.name)
+        if previous:
+            ratio = result['median_s'] / previous['median_s']
+            result['vs_baseline'] = round(ratio, 3)
+            if ratio > 1 + self.threshold:
+                pytest.fail(f'{self.name}: mediana {result["median_s"] * 1000:.3f} ms é {ratio:.2f}x a baseline '
+                            f'({previous["median_s"] * 1000:.3f} ms)')
+        return result
+
+
+@pytest.fixture(scope='session')
+def _baseline(pytestconfig):
+    path = pytestconfig.getoption('bench_compare')
+    if not path:
+        return None
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)['results']
+
+
+@pytest.fixture
+def bench(request, _baseline):
+    config = request.config
+    return Bench(request.node.name, config.getoption('bench_min_time'), config.getoption('bench_max_rounds'),
+                 _baseline, config.getoption('bench_threshold'))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not _results:
+        return
+    terminalreporter.section('microbenchmarks')
+    for name, r in sorted(_results.items()):
+        line = f'{name:<48} {r["median_s"] * 1000:>10.3f} ms  (min {r["min_s"] * 1000:.3f}, {r["rounds"]} rodadas)'
+        extra = {k: v for k, v in r.items() if k not in ('median_s', 'min_s', 'rounds', 'vs_baseline')}
+        if extra:
+            line += '  ' + ' '.join(f'{k}={v}' for k, v in extra.items())
+        if 'vs_baseline' in r:
+            line += f'  {r["vs_baseline"]:.2f}x baseline'
+        terminalreporter.write_line(line)
+    path = config.getoption('bench_save')
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        results = {name: {k: v for k, v in r.items() if k != 'vs_baseline'} for name, r in _results.items()}
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump({'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, fh, indent=2)
+        terminalreporter.write_line(f'baseline gravada em {path}')
@@ -0,0 +1,99 @@
+"""Gera um banco sintético para benchmarks e testes de carga.
+
+Cria `--users` usuários (`bench_0001`, `bench_0002`, ... todos com a mesma
+senha) e, para cada um, `--expenses-per-month` despesas em cada um dos
+últimos `--months` meses, com categorias e valores aleatórios porém
+reprodutíveis (`--seed`). O schema vem das migrações do app e o rollup é
+reconstruído no final, então o banco fica igual ao de uso real.
+
+Uso:
+  python benchmarks/seed_data.py --db bench.db --users 200 --months 24 --expenses-per-month 40
+  FINGEST_DB_PATH=bench.db python run_app.py --serve
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash  # noqa: E402
+
+from aggregates import rebuild_rollup  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+CATEGORIES = ('food', 'bills', 'transport', 'health', 'leisure', 'education', 'coffee', 'other')
+USERNAME_FORMAT = 'bench_{:04d}'
+DEFAULT_PASSWORD = 'BenchPass123!'
+
+
+def month_starts(months, today=None):
+    """First day of each of the last ``months`` months, oldest first."""
+    today = today or date.today()
+    year, month = today.year, today.month
+    result = []
+    for _ in range(months):
+        result.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return result[::-1]
+
+
+def seed(path, users, months, per_month, password=DEFAULT_PASSWORD, iterations=DEFAULT_PBKDF2_ITERATIONS,
+         seed_value=0):
+    rnd = random.Random(seed_value)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    migrate(conn)
+    # every user shares one hash: hashing thousands of passwords would dominate the run
+    pwhash = generate_password_hash(password, f'pbkdf2:sha256:{iterations}')
+    starts = month_starts(months)
+    # re-running appends users after the bench_* ones already there
+    first = conn.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'bench\\_%' ESCAPE '\\'").fetchone()[0] + 1
+    inserted = 0
+    for n in range(first, first + users):
+        username = USERNAME_FORMAT.format(n)
+        cur = conn.execute('INSERT INTO users (username, password, email, role) VALUES (?, ?, ?, ?)',
+                           (username, pwhash, f'{username}@bench.local', 'user'))
+        user_id = cur.lastrowid
+        conn.execute('INSERT INTO settings (user_id, monthly_limit) VALUES (?, ?)',
+                     (user_id, rnd.choice((1500.0, 3000.0, 5000.0))))
+        rows = [(rnd.randint(100, 50_000), rnd.choice(CATEGORIES),
+                 start.replace(day=rnd.randint(1, 28)).isoformat(), user_id)
+                for start in starts for _ in range(per_month)]
+        conn.executemany('INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (?, ?, ?, ?)', rows)
+        inserted += len(rows)
+    conn.commit()
+    rebuild_rollup(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return [USERNAME_FORMAT.format(n) for n in range(first, first + users)], inserted
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--db', default='bench.db')
+    p.add_argument('--users', type=int, default=100)
+    p.add_argument('--months', type=int, default=24)
+    p.add_argument('--expenses-per-month', type=int, default=30)
+    p.add_argument('--password', default=DEFAULT_PASSWORD)
+    p.add_argument('--iterations', type=int,
+                   default=int(os.environ.get('FINGEST_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS)),
+                   help='custo pbkdf2; use o mesmo FINGEST_PBKDF2_ITERATIONS do servidor')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    start = time.perf_counter()
+    usernames, inserted = seed(args.db, args.users, args.months, args.expenses_per_month, args.password,
+                               args.iterations, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f'{len(usernames)} usuários ({usernames[0]}..{usernames[-1]}), {inserted} despesas em {elapsed:.1f}s '
+          f'-> {os.path.abspath(args.db)}')
+
+
+if __name__ == '__main__':
+    main()
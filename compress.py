@@ -0,0 +1,197 @@
+"""Compressão das respostas (gzip; brotli e zstd quando instalados).
+
+`CompressionMiddleware` envolve o `app.wsgi_app` e comprime, conforme o
+`Accept-Encoding` do cliente, as respostas cujo tipo está em `MIMETYPES`.
+Respostas com `Content-Length` menor que `min_size` passam direto; as de
+tamanho desconhecido (geradores, como o export CSV) são comprimidas em
+fluxo, pedaço a pedaço, sem juntar o corpo na memória.
+
+Uma resposta comprimida não anuncia `Accept-Ranges` nem `Last-Modified` e tem
+o ETag enfraquecido. Um `If-Range` com ETag fraco nunca casa (RFC 9110), então
+o `Range` é descartado e o cliente recebe a resposta inteira. Assim um download
+retomado não junta bytes comprimidos com bytes da versão sem compressão.
+"""
+import time
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag, unquote_etag
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+MIMETYPES = frozenset({
+    'text/html', 'text/css', 'text/csv', 'text/plain', 'text/javascript', 'application/javascript',
+    'application/json', 'application/manifest+json', 'image/svg+xml',
+})
+MIN_SIZE = 500  # below this the headers cost more than the savings
+# used when the client rates several equally; zstd is ~3x faster than br at a similar ratio
+PREFERENCE = ('zstd', 'br', 'gzip')
+# tuned for per-request compression (bench_compression, 100k-row CSV / dashboard):
+# gzip 4 is 3.6x faster than 6 for 2.5% more bytes on the CSV; br 4 makes the
+# dashboard 7% smaller than br 2 at 0.3 ms; zstd 3 is 6% smaller than 1 at 0.1 ms
+DEFAULT_LEVELS = {'gzip': 4, 'br': 4, 'zstd': 3}
+SKIP_STATUSES = ('204', '206', '304')
+
+
+class _Brotli:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def available_encodings():
+    encodings = ['gzip']
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None or zstd is not None:
+        encodings.append('zstd')
+    return encodings
+
+
+def compressor(encoding, level):
+    """Object with ``compress(bytes)`` and ``flush()`` producing ``encoding``."""
+    if encoding == 'gzip':
+        return zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    if encoding == 'br':
+        return _Brotli(level)
+    if encoding == 'zstd':
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=level).compressobj()
+        return zstd.ZstdCompressor(level)  # flush() ends the frame, like compressobj
+    raise ValueError(f'codificação desconhecida: {encoding}')
+
+
+def negotiate(accept_encoding, encodings):
+    """Best of ``encodings`` (in preference order) for an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_q = None, 0
+    for encoding in encodings:
+        q = accept.quality(encoding)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def parse_levels(text):
+    """``'gzip=6,br=5'`` -> ``{'gzip': 6, 'br': 5}``."""
+    levels = {}
+    for part in (text or '').split(','):
+        name, _, level = part.partition('=')
+        if name.strip():
+            levels[name.strip()] = int(level)
+    return levels
+
+
+def _weak(etag):
+    value, weak = unquote_etag(etag)
+    return etag if weak or value is None else quote_etag(value, weak=True)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, encodings=PREFERENCE, levels=None, min_size=MIN_SIZE, mimetypes=MIMETYPES,
+                 on_finish=None):
+        self.app = app
+        available = available_encodings()
+        self.encodings = [e for e in encodings if e in available]
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.on_finish = on_finish  # called with (encoding, bytes in, bytes out, seconds)
+
+    def _compressible(self, status, headers):
+        if status[:3] in SKIP_STATUSES or 'Content-Encoding' in headers or 'Content-Range' in headers:
+            return False
+        if headers.get('Content-Type', '').split(';')[0].strip().lower() not in self.mimetypes:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        return True
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if self.encodings and environ.get('REQUEST_METHOD') != 'HEAD':
+            encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'), self.encodings)
+        state = {}
+        if_range = environ.get('HTTP_IF_RANGE', '').strip()
+        if 'HTTP_RANGE' in environ and if_range.startswith('W/'):
+            # a weak validator only ever came from a compressed response
+            environ = {k: v for k, v in environ.items() if k not in ('HTTP_RANGE', 'HTTP_IF_RANGE')}
+
+        def _start_response(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if not self._compressible(status, headers):
+                if status[:3] == '304' and 'ETag' in headers:
+                    # keep the validator the client saw on the compressed 200
+                    sent = parse_etags(environ.get('HTTP_IF_NONE_MATCH'))
+                    value, _ = unquote_etag(headers['ETag'])
+                    if value and sent.is_weak(value) and not sent.is_strong(value):
+                        headers['ETag'] = _weak(headers['ETag'])
+                return start_response(status, headers.to_wsgi_list(), exc_info)
+            _add_vary(headers)
+            length = headers.get('Content-Length', type=int)
+            if encoding is None or (length is not None and length < self.min_size):
+                return start_response(status, headers.to_wsgi_list(), exc_info)
+            state['compressor'] = compressor(encoding, self.levels[encoding])
+            headers['Content-Encoding'] = encoding
+            headers.remove('Content-Length')
+            # byte ranges of the identity file can't resume this stream
+            headers.remove('Accept-Ranges')
+            headers.remove('Last-Modified')
+            if 'ETag' in headers:
+                # the bytes differ from the identity response with the same tag
+                headers['ETag'] = _weak(headers['ETag'])
+            write = start_response(status, headers.to_wsgi_list(), exc_info)
+            return lambda data: write(state['compressor'].compress(data))
+
+        app_iter = self.app(environ, _start_response)
+        if 'compressor' not in state:
+            return app_iter
+        return ClosingIterator(self._compress(app_iter, state['compressor'], encoding),
+                               getattr(app_iter, 'close', None))
+
+    def _compress(self, app_iter, comp, encoding):
+        raw = out = 0
+        spent = 0.0
+        for chunk in app_iter:
+            if not chunk:
+                continue
+            start = time.perf_counter()
+            data = comp.compress(chunk)
+            spent += time.perf_counter() - start
+            raw += len(chunk)
+            if data:
+                out += len(data)
+                yield data
+        start = time.perf_counter()
+        data = comp.flush()
+        spent += time.perf_counter() - start
+        out += len(data)
+        yield data
+        if self.on_finish:
+            self.on_finish(encoding, raw, out, spent)
+
+
+def _add_vary(headers):
+    vary = [v.strip() for v in headers.get('Vary', '').split(',') if v.strip()]
+    if 'accept-encoding' not in (v.lower() for v in vary):
+        vary.append('Accept-Encoding')
+    headers['Vary'] = ', '.join(vary)
@@ -0,0 +1,82 @@
+"""Camada de conexões SQLite do Fingest.
+
+Mantém um pool de conexões já configuradas (WAL, pragmas ajustados e cache de
+statements) para que as rotas não paguem o custo de `sqlite3.connect` a cada
+chamada. Dentro de uma requisição Flask a conexão fica em `flask.g` e volta
+ao pool no teardown do app context.
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Pragmas applied once per physical connection.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,       # ~16 MB page cache
+    'mmap_size': 64 * 1024 * 1024,
+    'busy_timeout': 5000,       # ms
+    'temp_store': 'MEMORY',
+}
+
+
+class ConnectionPool:
+    def __init__(self, path, max_idle=8, pragmas=None, cached_statements=256, factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self.max_idle = max_idle
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _connect(self):
+        # Connections are handed to one request at a time, so they may move
+        # between threads of a threaded server.
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() >= self.max_idle:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+    def stats(self):
+        return {'created': self.created, 'reused': self.reused, 'idle': self._idle.qsize()}
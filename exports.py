@@ -0,0 +1,278 @@
+"""Exportação de despesas em streaming (CSV, CSV gzip e XLSX).
+
+As linhas vêm de um cursor lido em blocos (`fetchmany`), então a memória não
+cresce com o histórico do usuário e o primeiro byte sai antes do fim da
+consulta. O XLSX usa o workbook write-only do openpyxl, gravado num arquivo
+temporário e enviado em blocos.
+
+Exportações grandes (vários anos, ou todos os usuários para o admin) podem
+rodar como jobs assíncronos: o arquivo é gerado num pool de threads dentro do
+diretório de exports, o status fica na tabela `export_jobs` e pedidos
+idênticos (mesmo escopo, filtros, formato e versão dos dados) reaproveitam o
+mesmo artefato. Um job que continua `queued`/`running` depois de
+`stale_after` segundos (o processo morreu no meio) é marcado como `failed` e
+não é mais reaproveitado.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+COLUMNS = ('amount', 'category', 'date')
+ALL_USERS_COLUMNS = ('user_id',) + COLUMNS
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),  # Werkzeug adds the charset
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def columns_for(user_id=None):
+    return COLUMNS if user_id is not None else ALL_USERS_COLUMNS
+
+
+def build_query(user_id=None, start=None, end=None, category=None):
+    """Return ``(sql, params)`` selecting the exported columns with filters.
+
+    Without ``user_id`` every user's expenses are selected and the
+    ``user_id`` column is included.
+    """
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append('user_id = ?')
+        params.append(user_id)
+    if start:
+        clauses.append('date >= ?')
+        params.append(start)
+    if end:
+        clauses.append('date <= ?')
+        params.append(end)
+    if category:
+        clauses.append('category = ?')
+        params.append(category)
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    columns = ', '.join(columns_for(user_id))
+    return f'SELECT {columns} FROM expenses {where} ORDER BY date, id', params
+
+
+def has_rows(conn, **filters):
+    sql, params = build_query(**filters)
+    return conn.execute(f'SELECT EXISTS ({sql})', params).fetchone()[0] == 1
+
+
+def iter_rows(conn, chunk_size=1000, **filters):
+    sql, params = build_query(**filters)
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def iter_csv(rows, columns=COLUMNS, flush_bytes=64 * 1024):
+    """Yield CSV text in chunks of roughly ``flush_bytes``."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    amount_idx = columns.index('amount')
+    for row in rows:
+        row = list(row)
+        if row[amount_idx] is not None:
+            row[amount_idx] = f'{row[amount_idx]:.2f}'
+        writer.writerow(row)
+        if buf.tell() >= flush_bytes:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip-compress an iterable of text chunks on the fly."""
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = comp.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield comp.flush()
+
+
+def write_xlsx(rows, fileobj, columns=COLUMNS):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('expenses')
+    ws.append(columns)
+    for row in rows:
+        ws.append(tuple(row))
+    wb.save(fileobj)
+
+
+def iter_file(fileobj, chunk_size=64 * 1024):
+    try:
+        fileobj.seek(0)
+        while True:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        fileobj.close()
+
+
+def stream_export(conn_ctx, fmt, **filters):
+    """Yield the encoded export; ``conn_ctx`` is a context manager giving a connection.
+
+    The connection is held only while rows are being read, and released even
+    if the client disconnects mid-download.
+    """
+    columns = columns_for(filters.get('user_id'))
+    if fmt == 'xlsx':
+        tmp = tempfile.TemporaryFile()
+        with conn_ctx as conn:
+            write_xlsx(iter_rows(conn, **filters), tmp, columns)
+        yield from iter_file(tmp)
+        return
+    with conn_ctx as conn:
+        chunks = iter_csv(iter_rows(conn, **filters), columns)
+        if fmt == 'csv.gz':
+            yield from iter_gzip(chunks)
+        else:
+            for chunk in chunks:
+                yield chunk.encode('utf-8')
+
+
+class ExportJobManager:
+    """Build export artifacts in the background and keep them for a while."""
+
+    def __init__(self, pool, directory, max_workers=2, max_age=24 * 3600, max_bytes=512 * 1024 * 1024,
+                 stale_after=1800):
+        self.pool = pool
+        self.directory = directory
+        self.max_age = max_age
+        self.stale_after = stale_after
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._futures = set()
+
+    @staticmethod
+    def job_key(fmt, filters, version):
+        payload = json.dumps({'format': fmt, 'filters': filters, 'version': version}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def submit(self, conn, owner_id, fmt, filters, version):
+        """Queue an export, or return an identical job that is pending or done.
+
+        ``filters`` holds ``user_id`` (None for all users) plus the optional
+        date/category filters; ``version`` identifies the state of the data.
+        """
+        key = self.job_key(fmt, filters, version)
+        self._expire_stale(conn, key=key)
+        for job in conn.execute(
+                "SELECT * FROM export_jobs WHERE key = ? AND status IN ('queued', 'running', 'done') "
+                'ORDER BY created_at DESC', (key,)):
+            if job['status'] != 'done' or os.path.exists(self._path(job['filename'])):
+                return dict(job)
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            'INSERT INTO export_jobs (id, key, owner_id, format, params, status, created_at) '
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, key, owner_id, fmt, json.dumps(filters, sort_keys=True), time.time()))
+        conn.commit()
+        future = self._executor.submit(self._build, job_id, key, fmt, filters)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return self.get(conn, job_id)
+
+    def get(self, conn, job_id):
+        self._expire_stale(conn, job_id=job_id)
+        row = conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _expire_stale(self, conn, key=None, job_id=None):
+        # a build left unfinished by a dead process would otherwise be polled forever
+        column, value = ('key', key) if key is not None else ('id', job_id)
+        now = time.time()
+        cur = conn.execute(
+            "UPDATE export_jobs SET status = 'failed', error = ?, finished_at = ? "
+            f"WHERE {column} = ? AND status IN ('queued', 'running') AND created_at < ?",
+            ('interrompido: o processo que gerava o arquivo parou', now, value, now - self.stale_after))
+        if cur.rowcount:
+            conn.commit()
+
+    def artifact_path(self, job):
+        if job and job['status'] == 'done':
+            path = self._path(job['filename'])
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _set_status(self, job_id, **fields):
+        cols = ', '.join(f'{name} = ?' for name in fields)
+        with self.pool.connection() as conn:
+            conn.execute(f'UPDATE export_jobs SET {cols} WHERE id = ?', tuple(fields.values()) + (job_id,))
+            conn.commit()
+
+    def _build(self, job_id, key, fmt, filters):
+        self._set_status(job_id, status='running')
+        filename = f'{key}.{FORMATS[fmt][1]}'
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(f'.{job_id}.part')
+        try:
+            with open(tmp_path, 'wb') as fh:
+                for chunk in stream_export(self.pool.connection(), fmt, **filters):
+                    fh.write(chunk)
+            os.replace(tmp_path, self._path(filename))
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._set_status(job_id, status='failed', error=repr(e), finished_at=time.time())
+            return
+        self._set_status(job_id, status='done', filename=filename,
+                         size=os.path.getsize(self._path(filename)), finished_at=time.time())
+        self.purge()
+
+    def purge(self):
+        """Apply the retention policy: drop expired artifacts, then the oldest over budget."""
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM export_jobs WHERE status IN ('queued', 'running', 'failed') AND created_at < ?",
+                         (now - self.max_age,))
+            done = conn.execute(
+                "SELECT id, filename, size, finished_at FROM export_jobs WHERE status = 'done' "
+                'ORDER BY finished_at DESC').fetchall()
+            keep_bytes, seen, expired = 0, set(), []
+            for job in done:
+                fresh = job['finished_at'] >= now - self.max_age
+                if job['filename'] in seen and fresh:
+                    continue  # deduplicated jobs share one artifact
+                if fresh and keep_bytes + (job['size'] or 0) <= self.max_bytes:
+                    keep_bytes += job['size'] or 0
+                    seen.add(job['filename'])
+                else:
+                    expired.append(job)
+            for job in expired:
+                if job['filename'] not in seen:
+                    path = self._path(job['filename'])
+                    if os.path.exists(path):
+                        os.remove(path)
+                conn.execute('DELETE FROM export_jobs WHERE id = ?', (job['id'],))
+            conn.commit()
+        return len(expired)
+
+    def wait(self):
+        """Block until queued builds finish (used by tests and shutdown)."""
+        for future in list(self._futures):
+            future.result()
@@ -0,0 +1,106 @@
+"""Modelos de previsão de gastos mensais.
+
+Cada modelo recebe a série de totais mensais (mais antigo primeiro) e devolve
+o valor previsto para o próximo mês. O padrão é a regressão linear por mínimos
+quadrados em forma fechada, equivalente ao `LinearRegression` do scikit-learn
+sobre o índice do mês, mas sem importar nenhuma biblioteca pesada.
+"""
+import os
+
+MODELS = {}
+
+DEFAULT_MODEL = os.environ.get('FINGEST_FORECAST_MODEL', 'linear')
+
+
+def register(name):
+    def decorator(func):
+        MODELS[name] = func
+        return func
+    return decorator
+
+
+@register('linear')
+def linear_trend(values):
+    """Ordinary least squares of ``values`` on ``x = 0..n-1``, evaluated at ``n``."""
+    n = len(values)
+    if n < 2:
+        return float(values[-1])
+    mean_x = (n - 1) / 2.0
+    mean_y = sum(values) / n
+    sxx = sxy = 0.0
+    for x, y in enumerate(values):
+        dx = x - mean_x
+        sxx += dx * dx
+        sxy += dx * (y - mean_y)
+    slope = sxy / sxx
+    return mean_y + slope * (n - mean_x)
+
+
+@register('seasonal_naive')
+def seasonal_naive(values, season=12):
+    """Repeat the value observed one season ago (falls back to the last month)."""
+    if len(values) >= season:
+        return float(values[-season])
+    return float(values[-1])
+
+
+@register('exp_smoothing')
+def exponential_smoothing(values, alpha=0.5):
+    """Simple exponential smoothing; the forecast is the final level."""
+    level = float(values[0])
+    for y in values[1:]:
+        level = alpha * y + (1 - alpha) * level
+    return level
+
+
+def linear_trend_batch(series):
+    """Vectorized :func:`linear_trend` for many series at once.
+
+    ``series`` is a list of value lists (one per user, possibly of different
+    lengths). They are left-aligned in a zero-padded 2-D array with a mask,
+    and every regression is solved with the same array operations. Returns a
+    list of floats (0.0 for empty series).
+    """
+    import numpy as np  # only the batch path needs NumPy
+
+    if not series:
+        return []
+    width = max(len(s) for s in series) or 1
+    y = np.zeros((len(series), width))
+    mask = np.zeros((len(series), width))
+    for i, values in enumerate(series):
+        y[i, :len(values)] = values
+        mask[i, :len(values)] = 1.0
+    x = np.arange(width, dtype=float)
+
+    n = mask.sum(axis=1)
+    safe_n = np.where(n > 0, n, 1.0)
+    mean_x = (mask * x).sum(axis=1) / safe_n
+    mean_y = y.sum(axis=1) / safe_n
+    dx = (x - mean_x[:, None]) * mask
+    sxx = (dx * dx).sum(axis=1)
+    sxy = (dx * (y - mean_y[:, None])).sum(axis=1)
+    slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    # with a single month the slope is 0 and the forecast is that month
+    pred = mean_y + slope * (n - mean_x)
+    return np.where(n > 0, pred, 0.0).tolist()
+
+
+def forecast_batch(series, model=None, **params):
+    """Forecast every series in ``series``; vectorized for the linear model."""
+    name = model or DEFAULT_MODEL
+    if name == 'linear' and not params:
+        return linear_trend_batch(series)
+    return [forecast(values, model=name, **params) for values in series]
+
+
+def forecast(values, model=None, **params):
+    """Forecast the next value of ``values`` with the named model."""
+    if not values:
+        return 0.0
+    name = model or DEFAULT_MODEL
+    try:
+        func = MODELS[name]
+    except KeyError:
+        raise ValueError(f'unknown forecast model: {name!r}') from None
+    return float(func(list(values), **params))
@@ -0,0 +1,127 @@
+"""Hash de senhas fora da thread da requisição.
+
+`generate_password_hash`/`check_password_hash` (pbkdf2) ocupam a CPU por
+centenas de milissegundos; aqui rodam num pool de processos limitado. Quando
+há mais de `max_pending` operações em andamento a chamada falha na hora com
+`HasherBusy` (o app responde 503) em vez de enfileirar sem limite; o mesmo
+acontece se o resultado não chegar em `timeout` segundos. Uma operação que
+estourou o tempo continua ocupando sua vaga até o processo terminá-la.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Too many hashing operations in flight."""
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, max_pending=32, iterations=DEFAULT_PBKDF2_ITERATIONS,
+                 executor='process', timeout=30):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.iterations = iterations
+        self.executor_kind = executor
+        self.timeout = timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending else None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.max_pending_seen = 0
+
+    @property
+    def method(self):
+        return f'pbkdf2:sha256:{self.iterations}'
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                # the app runs threaded; forking a process that has other threads
+                # (scheduler, avatar/export pools) can copy held locks into the child
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, func, *args):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        with self._lock:
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                try:
+                    return func(*args)
+                finally:
+                    self._release()
+            try:
+                future = self._get_executor().submit(func, *args)
+            except BaseException:
+                self._release()
+                raise
+            # the slot is held until the work itself finishes, not just until we stop waiting
+            future.add_done_callback(lambda _: self._release())
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                future.cancel()  # only helps if it is still queued
+                with self._lock:
+                    self.timeouts += 1
+                raise HasherBusy() from None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.calls += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def warm(self):
+        """Start the worker processes now instead of on the first login."""
+        if self.workers:
+            executor = self._get_executor()
+            for future in [executor.submit(int) for _ in range(self.workers)]:
+                future.result(timeout=self.timeout)
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was made with a different method or cost."""
+        return (pwhash or '').split('$', 1)[0] != self.method
+
+    def stats(self):
+        with self._lock:
+            s = {'calls': self.calls, 'rejected': self.rejected, 'timeouts': self.timeouts,
+                 'total_seconds': self.total_seconds, 'max_seconds': self.max_seconds,
+                 'max_pending_seen': self.max_pending_seen, 'pending': self.pending,
+                 'workers': self.workers, 'iterations': self.iterations}
+        s['avg_seconds'] = round(s['total_seconds'] / s['calls'], 4) if s['calls'] else 0.0
+        return s
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,158 @@
+"""Importação em lote de despesas (CSV ou lista JSON).
+
+As linhas são validadas uma a uma enquanto o arquivo é lido; as válidas são
+inseridas com `executemany` em transações de `batch_size` linhas e os
+agregados (rollup e versão dos dados) são atualizados uma vez por lote. Linhas
+inválidas viram erros com o número da linha, sem abortar o restante.
+
+CSVs são lidos como UTF-8; bytes que não formam UTF-8 válido são decodificados
+como cp1252 (exportações do Excel e de bancos). Se o arquivo em si não puder
+ser lido (aspas quebradas, campo gigante), a leitura para ali: as linhas já
+inseridas continuam contadas em `inserted` e o problema vira um erro na linha
+onde a leitura parou.
+"""
+import codecs
+import csv
+import io
+import math
+from collections import defaultdict
+from datetime import date, datetime
+
+from aggregates import apply_rollup_delta, bump_data_version, to_cents
+
+FIELD_ALIASES = {
+    'amount': ('amount', 'valor'),
+    'category': ('category', 'categoria'),
+    'date': ('date', 'data'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
+MAX_REPORTED_ERRORS = 1000
+# keeps cents (and their sums in the rollups) far inside SQLite's 64-bit INTEGER
+MAX_AMOUNT = 10 ** 9
+
+
+def _cp1252_fallback(error):
+    # bytes cp1252 leaves undefined (0x81, 0x8d, ...) map to the same code point, as in latin-1
+    bad = error.object[error.start:error.end]
+    return ''.join(bytes([b]).decode('cp1252', errors='ignore') or chr(b) for b in bad), error.end
+
+
+codecs.register_error('fingest-cp1252', _cp1252_fallback)
+
+
+def parse_amount(value):
+    text = str(value if value is not None else '').strip().replace(',', '.')
+    if not text:
+        raise ValueError('valor ausente')
+    try:
+        amount = float(text)
+    except ValueError:
+        raise ValueError(f'valor inválido: {value!r}') from None
+    if not math.isfinite(amount) or abs(amount) > MAX_AMOUNT:
+        raise ValueError(f'valor fora do intervalo: {value!r}')
+    return amount
+
+
+def parse_date(value):
+    text = str(value or '').strip()
+    if not text:
+        return date.today().isoformat()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f'data inválida: {value!r}')
+
+
+def parse_record(record):
+    """Validate one mapping and return ``(amount, category, date)``."""
+    fields = {}
+    lowered = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+    for field, aliases in FIELD_ALIASES.items():
+        fields[field] = next((lowered[a] for a in aliases if a in lowered), None)
+    category = str(fields['category'] or '').strip()
+    if not category:
+        raise ValueError('categoria ausente')
+    return parse_amount(fields['amount']), category, parse_date(fields['date'])
+
+
+def iter_csv_records(stream, encoding='utf-8-sig'):
+    """Yield ``(line_number, record)`` from a binary CSV upload, streaming."""
+    text = io.TextIOWrapper(stream, encoding=encoding, errors='fingest-cp1252', newline='')
+    sample = text.read(4096)
+    sample += text.readline()  # don't split a row between sample and rest
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(_chain(sample, text), dialect=dialect)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _chain(head, rest):
+    yield from io.StringIO(head)
+    yield from rest
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {'inserted': self.inserted, 'error_count': self.error_count, 'errors': self.errors}
+
+
+def import_records(conn, user_id, records, batch_size=500):
+    """Insert validated ``(line, record)`` pairs for ``user_id``; returns an ImportResult."""
+    result = ImportResult()
+    batch = []
+    line = 0
+    records = iter(records)
+    while True:
+        try:
+            line, record = next(records)
+        except StopIteration:
+            break
+        except (csv.Error, UnicodeDecodeError) as e:
+            # the reader can't go on; keep what was read so far and say where it stopped
+            result.add_error(line + 1, f'arquivo inválido, importação interrompida: {e}')
+            break
+        try:
+            batch.append(parse_record(record))
+        except (ValueError, AttributeError) as e:
+            result.add_error(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _flush(conn, user_id, batch, result)
+            batch = []
+    if batch:
+        _flush(conn, user_id, batch, result)
+    return result
+
+
+def _flush(conn, user_id, batch, result):
+    rows = [(to_cents(amount), category, date_str, user_id) for amount, category, date_str in batch]
+    buckets = defaultdict(lambda: [0, 0])
+    for cents, category, date_str, _ in rows:
+        bucket = buckets[(date_str[:7], category)]
+        bucket[0] += cents
+        bucket[1] += 1
+    try:
+        conn.executemany('INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (?, ?, ?, ?)', rows)
+        for (month, category), (cents, count) in buckets.items():
+            apply_rollup_delta(conn, user_id, month, category, cents, count)
+        bump_data_version(conn, user_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    result.inserted += len(batch)
@@ -0,0 +1,95 @@
+"""Listagens paginadas por cursor (keyset).
+
+Despesas são ordenadas por ``(date, id)``: cada página continua exatamente de
+onde a anterior parou usando a comparação ``(date, id) < (?, ?)`` sobre os
+índices de `expenses`, então a página 1000 custa o mesmo que a primeira. A
+lista de usuários do admin faz o mesmo com ``id``.
+"""
+import base64
+import json
+
+from aggregates import to_cents
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(date_str, expense_id):
+    raw = json.dumps([date_str, expense_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(date, id)``; raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date_str, expense_id = json.loads(raw)
+        return str(date_str), int(expense_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('cursor inválido') from e
+
+
+def list_expenses(conn, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, start=None, end=None,
+                  category=None, min_amount=None, max_amount=None):
+    """Return ``(rows, next_cursor)`` newest first; ``next_cursor`` is None on the last page."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = ['user_id = ?'], [user_id]
+    if category:
+        clauses.append('category = ?')
+        params.append(category)
+    if start:
+        clauses.append('date >= ?')
+        params.append(start)
+    if end:
+        clauses.append('date <= ?')
+        params.append(end)
+    if min_amount is not None:
+        clauses.append('amount_cents >= ?')
+        params.append(to_cents(min_amount))
+    if max_amount is not None:
+        clauses.append('amount_cents <= ?')
+        params.append(to_cents(max_amount))
+    if cursor:
+        clauses.append('(date, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    cur = conn.execute(
+        f'SELECT id, amount, category, date FROM expenses WHERE {" AND ".join(clauses)} '
+        'ORDER BY date DESC, id DESC LIMIT ?', params + [limit + 1])
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['date'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def list_users(conn, limit=DEFAULT_PAGE_SIZE, cursor=None, q=None, role=None):
+    """Return ``(rows, next_cursor)`` ordered by id; ``q`` matches part of the username.
+
+    ``cursor`` is the last id of the previous page. A role filter walks
+    ``idx_users_role``; a text search scans in id order until the page is full.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = [], []
+    if role:
+        clauses.append('u.role = ?')
+        params.append(role)
+    if q:
+        clauses.append("u.username LIKE ? ESCAPE '\\'")
+        params.append('%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if cursor:
+        try:
+            params.append(int(cursor))
+        except ValueError as e:
+            raise ValueError('cursor inválido') from e
+        clauses.append('u.id > ?')
+    where = f'WHERE {" AND ".join(clauses)} ' if clauses else ''
+    cur = conn.execute(
+        'SELECT u.id, u.username, u.email, u.role, f.prediction FROM users u '
+        f'LEFT JOIN forecasts f ON f.user_id = u.id {where}ORDER BY u.id LIMIT ?', params + [limit + 1])
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1]['id'])
+    return rows, next_cursor
@@ -0,0 +1,298 @@
+"""Métricas de desempenho por requisição, em formato texto do Prometheus.
+
+Cada requisição ganha um `RequestTimings` (num contextvar) onde a camada SQL
+(`InstrumentedConnection`, usada pelo pool de `get_db()`), a renderização de
+templates e blocos marcados com `span()` somam seu tempo. No fim da
+requisição os valores alimentam os histogramas por endpoint e podem virar um
+cabeçalho `Server-Timing`. Os contadores são por processo.
+"""
+import contextvars
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, values)} {_format_number(total)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float('inf'),), series):
+                    cumulative += n
+                    le = f'le="{_format_number(float(bound))}"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labels, values, [le])} {cumulative}')
+                labels = _format_labels(self.labels, values)
+                lines.append(f'{self.name}_sum{labels} {_format_number(series[-1])}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('fingest_request_duration_seconds', 'Request latency until the response is returned.',
+                            LATENCY_BUCKETS, ('endpoint', 'method'))
+REQUESTS = Counter('fingest_requests_total', 'Requests by endpoint and status.', ('endpoint', 'method', 'status'))
+REQUEST_SQL_QUERIES = Histogram('fingest_request_sql_queries', 'SQL statements executed per request.',
+                                SQL_COUNT_BUCKETS, ('endpoint',))
+REQUEST_SQL_SECONDS = Histogram('fingest_request_sql_seconds', 'Time spent in SQLite per request.',
+                                SQL_SECONDS_BUCKETS, ('endpoint',))
+SPAN_SECONDS = Histogram('fingest_span_duration_seconds', 'Time spent in instrumented blocks (render, forecast).',
+                         LATENCY_BUCKETS, ('span', 'endpoint'))
+SQL_QUERIES = Counter('fingest_sql_queries_total', 'SQL statements executed, including background jobs.')
+SQL_SECONDS = Counter('fingest_sql_seconds_total', 'Time spent in SQLite, including background jobs.')
+COMPRESSION_BYTES = Counter('fingest_compression_bytes_total', 'Response bytes before (in) and after (out) compression.',
+                            ('encoding', 'stage'))
+COMPRESSION_SECONDS = Counter('fingest_compression_seconds_total', 'CPU time spent compressing responses.',
+                              ('encoding',))
+
+ALL_METRICS = (REQUEST_SECONDS, REQUESTS, REQUEST_SQL_QUERIES, REQUEST_SQL_SECONDS, SPAN_SECONDS,
+               SQL_QUERIES, SQL_SECONDS, COMPRESSION_BYTES, COMPRESSION_SECONDS)
+
+
+class RequestTimings:
+    __slots__ = ('start', 'sql_count', 'sql_seconds', 'spans')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.spans = {}
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+_current = contextvars.ContextVar('fingest_request_timings', default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def current():
+    return _current.get()
+
+
+def finish_request(endpoint, method, status):
+    """Record the current request in the histograms and return its timings (or None)."""
+    timings = _current.get()
+    if timings is None:
+        return None
+    _current.set(None)
+    endpoint = endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(timings.elapsed(), endpoint, method)
+    REQUESTS.inc(1, endpoint, method, str(status))
+    REQUEST_SQL_QUERIES.observe(timings.sql_count, endpoint)
+    REQUEST_SQL_SECONDS.observe(timings.sql_seconds, endpoint)
+    for name, seconds in timings.spans.items():
+        SPAN_SECONDS.observe(seconds, name, endpoint)
+    return timings
+
+
+def record_sql(seconds, queries=1):
+    SQL_QUERIES.inc(queries)
+    SQL_SECONDS.inc(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.sql_count += queries
+        timings.sql_seconds += seconds
+
+
+def record_compression(encoding, raw, compressed, seconds):
+    COMPRESSION_BYTES.inc(raw, encoding, 'in')
+    COMPRESSION_BYTES.inc(compressed, encoding, 'out')
+    COMPRESSION_SECONDS.inc(seconds, encoding)
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.add_span(name, time.perf_counter() - start)
+
+
+def server_timing(timings):
+    """``Server-Timing`` header value for ``timings``."""
+    parts = [f'app;dur={timings.elapsed() * 1000:.1f}',
+             f'sql;dur={timings.sql_seconds * 1000:.1f};desc="{timings.sql_count} queries"']
+    parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.spans.items()]
+    return ', '.join(parts)
+
+
+def render():
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # fetches and iteration are timed too: for plain SELECTs most of the work
+    # happens there. Iterated rows are reported in batches to keep the
+    # per-row overhead down.
+    ITER_REPORT_ROWS = 256
+    _iter_rows = 0
+    _iter_seconds = 0.0
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            record_sql(time.perf_counter() - start, queries=0)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._iter_seconds += time.perf_counter() - start
+            self._report_iter()
+            raise
+        self._iter_seconds += time.perf_counter() - start
+        self._iter_rows += 1
+        if self._iter_rows >= self.ITER_REPORT_ROWS:
+            self._report_iter()
+        return row
+
+    def _report_iter(self):
+        if self._iter_seconds:
+            record_sql(self._iter_seconds, queries=0)
+        self._iter_rows = 0
+        self._iter_seconds = 0.0
+
+    def close(self):
+        self._report_iter()  # a loop that stopped early
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are counted and timed via `record_sql`."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record_sql(time.perf_counter() - start, queries=0)
@@ -0,0 +1,235 @@
+"""Migrações versionadas do schema SQLite.
+
+A versão aplicada fica em `PRAGMA user_version`. Cada migração roda numa
+transação própria (`BEGIN IMMEDIATE`, então processos concorrentes esperam e
+não aplicam a mesma migração duas vezes) e, se alguma for aplicada, o banco
+recebe um `ANALYZE` no final. Migrações já publicadas não devem ser editadas:
+mudanças novas entram como uma nova função no fim da lista.
+"""
+import time
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(func):
+        assert not MIGRATIONS or MIGRATIONS[-1][0] == version - 1, 'migrations must be sequential'
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to ``target``; returns ``[(version, description, seconds)]``."""
+    target = latest_version() if target is None else target
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version > target or version <= current_version(conn):
+            continue
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # another process may have migrated while we waited for the lock
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            func(conn)
+            conn.execute(f'PRAGMA user_version = {version:d}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description, time.perf_counter() - start))
+    if applied:
+        conn.execute('ANALYZE')
+        conn.commit()
+    return applied
+
+
+@migration(1, 'baseline schema')
+def _baseline(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT,
+        email TEXT,
+        role TEXT,
+        photo TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount REAL,
+        category TEXT,
+        date TEXT,
+        user_id INTEGER,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        user_id INTEGER PRIMARY KEY,
+        monthly_limit REAL,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS expense_monthly_rollup (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS forecasts (
+        user_id INTEGER PRIMARY KEY,
+        prediction REAL NOT NULL,
+        months INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        data_version INTEGER NOT NULL,
+        computed_at TEXT NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS scheduler_lock (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS export_jobs (
+        id TEXT PRIMARY KEY,
+        key TEXT NOT NULL,
+        owner_id INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        filename TEXT,
+        size INTEGER,
+        error TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+    ''')
+
+
+def _expense_indexes(conn):
+    # both end with the implicit rowid, i.e. they are ordered by (date, id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date ON expenses (user_id, category, date)')
+
+
+@migration(2, 'expense indexes')
+def _indexes(conn):
+    _expense_indexes(conn)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_key ON export_jobs (key)')
+
+
+# DD/MM/YYYY and timestamps become plain YYYY-MM-DD
+_NORMALIZED_DATE = '''
+CASE
+    WHEN date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]*'
+        THEN substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2)
+    WHEN date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]?*' THEN substr(date, 1, 10)
+    ELSE date
+END
+'''
+
+
+@migration(3, 'integer-cent amounts and normalized dates')
+def _integer_cents(conn):
+    conn.execute('''
+    CREATE TABLE expenses_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount_cents INTEGER NOT NULL DEFAULT 0,
+        category TEXT,
+        date TEXT,
+        user_id INTEGER,
+        amount REAL GENERATED ALWAYS AS (amount_cents / 100.0) VIRTUAL,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    ''')
+    conn.execute(f'''
+    INSERT INTO expenses_new (id, amount_cents, category, date, user_id)
+    SELECT id, CAST(round(COALESCE(amount, 0) * 100) AS INTEGER), category, {_NORMALIZED_DATE}, user_id
+    FROM expenses
+    ''')
+    conn.execute('DROP TABLE expenses')
+    conn.execute('ALTER TABLE expenses_new RENAME TO expenses')
+    _expense_indexes(conn)
+
+    conn.execute('DROP TABLE expense_monthly_rollup')
+    conn.execute('''
+    CREATE TABLE expense_monthly_rollup (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT INTO expense_monthly_rollup (user_id, month, category, total_cents, count)
+    SELECT user_id, COALESCE(substr(date, 1, 7), ''), COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+    FROM expenses GROUP BY 1, 2, 3
+    ''')
+
+
+@migration(4, 'global monthly rollup and user role index')
+def _global_rollup(conn):
+    conn.execute('''
+    CREATE TABLE global_monthly_rollup (
+        month TEXT PRIMARY KEY,
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        active_users INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT INTO global_monthly_rollup (month, total_cents, count, active_users)
+    SELECT month, SUM(total_cents), SUM(count), COUNT(DISTINCT user_id)
+    FROM expense_monthly_rollup GROUP BY month
+    ''')
+    # ends with the implicit rowid: the admin listing pages by (role, id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)')
+
+
+@migration(5, 'admin stats row')
+def _admin_stats(conn):
+    # a single row (id = 1) kept up to date by register, set_role and the forecast refresh
+    conn.execute('''
+    CREATE TABLE admin_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        user_count INTEGER NOT NULL DEFAULT 0,
+        admin_count INTEGER NOT NULL DEFAULT 0,
+        projected REAL NOT NULL DEFAULT 0,
+        forecast_at TEXT
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO admin_stats (id, user_count, admin_count, projected, forecast_at)
+    SELECT 1, (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM users WHERE role = 'admin'),
+           COALESCE(SUM(prediction), 0), MAX(computed_at)
+    FROM forecasts
+    ''')
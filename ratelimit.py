@@ -0,0 +1,138 @@
+"""Backends de rate limiting para o decorator `rate_limit` do app.
+
+Ambos usam uma janela deslizante aproximada (contagem da janela atual mais a
+fração restante da anterior), com custo O(1) por verificação e estado fixo
+por chave:
+
+- `MemoryRateLimiter`: dict LRU em memória com número máximo de chaves;
+  chaves ociosas saem primeiro.
+- `SQLiteRateLimiter`: mesmo algoritmo num arquivo SQLite compartilhado, para
+  que o limite valha entre vários processos workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from db import ConnectionPool
+
+
+def _sliding_count(now, per, window_start, current, previous):
+    """Roll the window forward and return ``(window_start, current, previous, estimate)``."""
+    elapsed_windows = int((now - window_start) // per)
+    if elapsed_windows >= 2:
+        window_start, current, previous = window_start + elapsed_windows * per, 0, 0
+    elif elapsed_windows == 1:
+        window_start, current, previous = window_start + per, 0, current
+    weight = 1.0 - (now - window_start) / per
+    return window_start, current, previous, current + previous * weight
+
+
+class MemoryRateLimiter:
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> [window_start, current, previous, per]
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def hit(self, key, limit, per, now=None):
+        """Count one request for ``key``; False if it exceeds ``limit`` per ``per`` seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [now, 0, 0, per]
+                self._entries[key] = entry
+                if len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._entries.move_to_end(key)
+            start, current, previous, estimate = _sliding_count(now, per, entry[0], entry[1], entry[2])
+            if estimate >= limit:
+                entry[:3] = start, current, previous
+                return False
+            entry[:3] = start, current + 1, previous
+            return True
+
+    def purge(self, now=None):
+        """Drop keys whose last two windows are over; returns how many."""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = [k for k, (start, _, _, per) in self._entries.items() if now - start >= 2 * per]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteRateLimiter:
+    def __init__(self, path):
+        self.pool = ConnectionPool(path)
+        with self.pool.connection() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                per REAL NOT NULL
+            ) WITHOUT ROWID
+            ''')
+            conn.commit()
+
+    def hit(self, key, limit, per, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            # IMMEDIATE takes the write lock up front so concurrent workers
+            # serialize on the read-modify-write below
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT window_start, current, previous FROM rate_limits WHERE key = ?',
+                                   (key,)).fetchone()
+                state = tuple(row) if row else (now, 0, 0)
+                start, current, previous, estimate = _sliding_count(now, per, *state)
+                allowed = estimate < limit
+                conn.execute('INSERT OR REPLACE INTO rate_limits (key, window_start, current, previous, per) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (key, start, current + 1 if allowed else current, previous, per))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return allowed
+
+    def purge(self, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            cur = conn.execute('DELETE FROM rate_limits WHERE ? - window_start >= 2 * per', (now,))
+            conn.commit()
+            return cur.rowcount
+
+    def reset(self):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM rate_limits')
+            conn.commit()
+
+    def close(self):
+        self.pool.close_all()
+
+    def __len__(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+
+
+def create_rate_limiter(backend, sqlite_path=None, max_keys=100_000):
+    if backend == 'memory':
+        return MemoryRateLimiter(max_keys=max_keys)
+    if backend == 'sqlite':
+        return SQLiteRateLimiter(sqlite_path)
+    raise ValueError(f'unknown rate limit backend: {backend!r}')
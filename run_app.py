@@ -1,26 +1,104 @@
-import os
-import threading
-import time
-import webbrowser
+from startup import StartupProfile
+
+# started before anything heavy is imported; --profile-startup reports from here
+profile = StartupProfile()
+
+import argparse  # noqa: E402
+import multiprocessing  # noqa: E402
+import os  # noqa: E402
+import threading  # noqa: E402
+import urllib.request  # noqa: E402
+import webbrowser  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fingest')
+    parser.add_argument('--serve', action='store_true',
+                        help='modo produção: servidor WSGI multi-worker em vez do servidor de desenvolvimento')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='mede imports, inicialização e tempo até a primeira resposta, depois sai')
+    parser.add_argument('--host', default=os.environ.get('FINGEST_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FINGEST_PORT', 5000)))
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'waitress'),
+                        default=os.environ.get('FINGEST_SERVER', 'auto'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('FINGEST_WORKERS', 0)) or None,
+                        help='processos (gunicorn); padrão 2 * CPUs + 1')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('FINGEST_THREADS', 4)))
+    parser.add_argument('--timeout', type=int, default=30)
+    parser.add_argument('--graceful-timeout', type=int, default=30)
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='recicla cada worker após N requisições (0 = nunca)')
+    return parser.parse_args(argv)
+
+
+def serve_desktop(app, warm_up, args):
+    from werkzeug.serving import make_server
+
+    # the socket is listening once make_server returns, so the browser can
+    # open right away; everything not needed for the first page warms up
+    # in the background
+    with profile.phase('bind'):
+        server = make_server(args.host, args.port, app, threaded=True)
+    url = f'http://{args.host}:{server.port}'
+    if args.profile_startup:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        with profile.phase('first response (/login)'):
+            urllib.request.urlopen(url + '/login').read()
+        ready = profile.elapsed()
+        with profile.phase('warm-up (background)'):
+            warmed = warm_up()
+        server.shutdown()
+        print(profile.report())
+        print('\n' + '\n'.join(f'  warm-up {name:<19} {seconds * 1000:>9.1f}' for name, seconds in warmed.items()))
+        print(f'\nPrimeira resposta em {ready * 1000:.0f} ms desde o início do run_app.py.')
+        return
+    threading.Thread(target=warm_up, daemon=True).start()
+    threading.Thread(target=webbrowser.open, args=(url,), daemon=True).start()
+    print(f' * Fingest em {url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
-from app import app, init_db
 
 if __name__ == '__main__':
+    # the password hasher uses a process pool; required for frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
+    args = parse_args()
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     # ensure DB path is set to project DB by default
     os.environ.setdefault('FINGEST_DB_PATH', os.path.join(BASE_DIR, 'database.db'))
     # create uploads folder
     os.makedirs(os.path.join(BASE_DIR, 'static', 'uploads'), exist_ok=True)
-    init_db()
-
-    def open_browser(url):
-        time.sleep(1.2)
-        try:
-            webbrowser.open(url)
-        except Exception:
-            pass
-
-    url = 'http://127.0.0.1:5000'
-    threading.Thread(target=open_browser, args=(url,), daemon=True).start()
-    # run flask app
-    app.run(host='127.0.0.1', port=5000)
+    if args.serve:
+        from server import choose_server, default_workers, hash_pool_size
+
+        if choose_server(args.server) == 'gunicorn':
+            # every gunicorn worker builds its own hasher when app is imported; split the budget
+            args.workers = args.workers or default_workers()
+            hash_workers, max_pending = hash_pool_size(
+                args.workers, int(os.environ.get('FINGEST_HASH_MAX_PENDING', 32)))
+            os.environ.setdefault('FINGEST_HASH_WORKERS', str(hash_workers))
+            os.environ['FINGEST_HASH_MAX_PENDING'] = str(max_pending)
+    with profile.phase('import app'), profile.track_imports():
+        from app import app, close_connections, init_db, init_worker, shutdown_worker, warm_up
+
+    # migrations run once here, before any worker exists
+    with profile.phase('init_db'):
+        init_db()
+
+    if args.serve:
+        import logging
+
+        from server import serve
+
+        logging.basicConfig(level=logging.INFO)
+        logging.getLogger('apscheduler').setLevel(logging.WARNING)
+        close_connections()
+        serve(app, host=args.host, port=args.port, workers=args.workers, threads=args.threads,
+              server=args.server, timeout=args.timeout, graceful_timeout=args.graceful_timeout,
+              max_requests=args.max_requests, on_worker_start=init_worker, on_worker_exit=shutdown_worker)
+    else:
+        serve_desktop(app, warm_up, args)
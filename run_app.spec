@@ -6,11 +6,11 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates'), ('static', 'static'), ('icon.ico', '.')],
-    hiddenimports=['sklearn', 'pandas'],
+    hiddenimports=['openpyxl', 'waitress'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['sklearn', 'pandas'],
     noarchive=False,
     optimize=0,
 )
@@ -26,7 +26,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-packed binaries are decompressed on every launch
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
@@ -0,0 +1,140 @@
+"""Agendador de tarefas em segundo plano (APScheduler).
+
+Tarefas pesadas (reconstruir rollups, recalcular previsões, VACUUM/ANALYZE)
+rodam fora das requisições, à noite ou sob demanda. Como vários processos
+podem iniciar o agendador, as tarefas exclusivas só executam no processo que
+detém um lease gravado no próprio SQLite; tarefas não exclusivas (estado em
+memória de cada processo) rodam em todos. Enquanto uma tarefa exclusiva roda,
+uma thread renova o lease a cada terço do TTL, então uma tarefa mais longa que
+o TTL não deixa outro processo assumir no meio.
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+class JobScheduler:
+    def __init__(self, pool, lock_name='jobs', lock_ttl=300):
+        self.pool = pool
+        self.lock_name = lock_name
+        self.lock_ttl = lock_ttl
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.jobs = {}
+        self.metrics = {}
+        self._run_lock = threading.Lock()
+        self._scheduler = None
+
+    def job(self, name, trigger, exclusive=True, **trigger_args):
+        """Register ``func(conn)`` as job ``name`` with an APScheduler trigger."""
+        def decorator(func):
+            self.jobs[name] = (func, trigger, trigger_args, exclusive)
+            self.metrics[name] = {'runs': 0, 'failures': 0, 'skipped': 0, 'last_run': None,
+                                  'last_duration': None, 'total_duration': 0.0, 'last_error': None}
+            return func
+        return decorator
+
+    def acquire_lease(self, conn):
+        """Take or renew the single-instance lease; True if this process holds it."""
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT owner, expires_at FROM scheduler_lock WHERE name = ?',
+                               (self.lock_name,)).fetchone()
+            if row and row['owner'] != self.owner and row['expires_at'] > now:
+                return False
+            conn.execute('INSERT OR REPLACE INTO scheduler_lock (name, owner, expires_at) VALUES (?, ?, ?)',
+                         (self.lock_name, self.owner, now + self.lock_ttl))
+            return True
+        finally:
+            conn.commit()
+
+    def renew_lease(self):
+        """Push our lease's expiry forward; False if another process took it over."""
+        with self.pool.connection() as conn:
+            renewed = conn.execute('UPDATE scheduler_lock SET expires_at = ? WHERE name = ? AND owner = ?',
+                                   (time.time() + self.lock_ttl, self.lock_name, self.owner)).rowcount
+            conn.commit()
+        return bool(renewed)
+
+    def _keep_lease(self, stop):
+        while not stop.wait(self.lock_ttl / 3):
+            try:
+                if not self.renew_lease():
+                    log.warning('scheduler lease %s lost while a job was running', self.lock_name)
+                    return
+            except Exception:
+                log.exception('could not renew scheduler lease %s', self.lock_name)
+
+    def release_lease(self):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM scheduler_lock WHERE name = ? AND owner = ?', (self.lock_name, self.owner))
+            conn.commit()
+
+    def run(self, name):
+        """Run a job now, recording its duration. Returns False if skipped."""
+        func, _, _, exclusive = self.jobs[name]
+        m = self.metrics[name]
+        with self.pool.connection() as conn:
+            if exclusive and not self.acquire_lease(conn):
+                m['skipped'] += 1
+                return False
+            stop = threading.Event()
+            if exclusive:
+                threading.Thread(target=self._keep_lease, args=(stop,), name=f'lease-{name}', daemon=True).start()
+            start = time.perf_counter()
+            try:
+                with self._run_lock:
+                    func(conn)
+            except Exception as e:
+                m['failures'] += 1
+                m['last_error'] = repr(e)
+                raise
+            finally:
+                stop.set()
+                elapsed = time.perf_counter() - start
+                m['runs'] += 1
+                m['last_run'] = datetime.now().isoformat(timespec='seconds')
+                m['last_duration'] = round(elapsed, 4)
+                m['total_duration'] = round(m['total_duration'] + elapsed, 4)
+        return True
+
+    def _run_logged(self, name):
+        try:
+            self.run(name)
+        except Exception:
+            # counted in metrics too; log the traceback and keep the scheduler alive
+            log.exception('scheduled job %s failed', name)
+
+    def start(self):
+        if self._scheduler is not None:
+            return self._scheduler
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        sched = BackgroundScheduler(daemon=True)
+        for name, (_, trigger, trigger_args, _) in self.jobs.items():
+            sched.add_job(self._run_logged, trigger, args=(name,), id=name, name=name, coalesce=True,
+                          max_instances=1, misfire_grace_time=3600, **trigger_args)
+        sched.start()
+        self._scheduler = sched
+        atexit.register(self.shutdown)
+        return sched
+
+    def shutdown(self):
+        if self._scheduler is None:
+            return
+        self._scheduler.shutdown(wait=False)
+        self._scheduler = None
+        try:
+            self.release_lease()
+        except Exception:
+            pass
+
+    def stats(self):
+        return {'owner': self.owner, 'running': self._scheduler is not None, 'jobs': self.metrics}
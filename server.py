@@ -0,0 +1,122 @@
+"""Modo de produção: serve o app por um servidor WSGI com vários workers.
+
+- `gunicorn` (Linux/macOS): `workers` processos, cada um com `threads`
+  threads (worker `gthread`). O app é carregado uma vez no processo mestre
+  (migrações rodam só ali) e cada worker chama `on_worker_start` logo após o
+  fork para abrir seus próprios recursos. `kill -HUP` troca os workers sem
+  derrubar conexões; `kill -TERM` espera até `graceful_timeout` segundos
+  pelas requisições em andamento. O pool de hash de senhas de cada worker é
+  dimensionado por `hash_pool_size`, para que o total de processos pbkdf2 e
+  o limite de hashes pendentes valham para o servidor inteiro.
+- `waitress` (Windows, ou quando gunicorn não está instalado): um processo
+  com `threads` threads; SIGINT/SIGTERM param de aceitar conexões e esperam
+  as requisições em andamento.
+"""
+import logging
+import os
+import signal
+
+log = logging.getLogger(__name__)
+
+SERVERS = ('gunicorn', 'waitress')
+
+
+def default_workers():
+    return (os.cpu_count() or 1) * 2 + 1
+
+
+def hash_pool_size(workers, max_pending, cpus=None):
+    """Per-worker ``(hash processes, max pending)`` for ``workers`` gunicorn processes.
+
+    Each worker gets ``cpus // workers`` pbkdf2 processes (0 = hash in the
+    request thread), so the server never runs more hashing processes than
+    CPUs, and an even share of the server-wide ``max_pending``.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    return min(4, cpus // workers), max(1, max_pending // workers)
+
+
+def choose_server(name='auto'):
+    if name in SERVERS:
+        return name
+    if name != 'auto':
+        raise ValueError(f'unknown server: {name!r}')
+    if os.name != 'nt':
+        try:
+            import gunicorn  # noqa: F401
+            return 'gunicorn'
+        except ImportError:
+            pass
+    return 'waitress'
+
+
+def gunicorn_options(host, port, workers, threads, timeout=30, graceful_timeout=30, max_requests=0,
+                     on_worker_start=None, on_worker_exit=None):
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'preload_app': True,
+        'max_requests': max_requests,
+        # spread restarts so all workers don't recycle at once
+        'max_requests_jitter': max_requests // 10,
+    }
+    if on_worker_start:
+        options['post_fork'] = lambda server, worker: on_worker_start()
+    if on_worker_exit:
+        options['worker_exit'] = lambda server, worker: on_worker_exit()
+    return options
+
+
+def serve(app, host='127.0.0.1', port=8000, workers=None, threads=4, server='auto', timeout=30,
+          graceful_timeout=30, max_requests=0, on_worker_start=None, on_worker_exit=None):
+    """Run ``app`` until shut down; blocks the calling (main) thread."""
+    server = choose_server(server)
+    if server == 'gunicorn':
+        options = gunicorn_options(host, port, workers or default_workers(), threads, timeout, graceful_timeout,
+                                   max_requests, on_worker_start, on_worker_exit)
+        _serve_gunicorn(app, options)
+    else:
+        if workers and workers > 1:
+            log.info('waitress runs a single process; using %d threads', threads)
+        _serve_waitress(app, host, port, threads, graceful_timeout, on_worker_start, on_worker_exit)
+
+
+def _serve_gunicorn(app, options):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application().run()
+
+
+def _serve_waitress(app, host, port, threads, graceful_timeout, on_worker_start, on_worker_exit):
+    from waitress.server import create_server
+
+    if on_worker_start:
+        on_worker_start()
+    httpd = create_server(app, host=host, port=port, threads=threads)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    log.info('serving on http://%s:%d with %d threads', host, port, threads)
+    try:
+        httpd.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.close()  # stop accepting; let in-flight requests finish
+        httpd.task_dispatcher.shutdown(cancel_pending=False, timeout=graceful_timeout)
+        if on_worker_exit:
+            on_worker_exit()
@@ -0,0 +1,66 @@
+"""Medição do tempo de inicialização (`run_app.py --profile-startup`).
+
+`StartupProfile` cronometra fases nomeadas a partir da criação do objeto e,
+dentro de `track_imports()`, o tempo de cada import feito pela primeira vez
+(inclusivo: um módulo conta também o que ele importa).
+"""
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []   # (name, seconds, seconds since start at the end)
+        self.imports = []  # (module, seconds, depth)
+        self._depth = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases.append((name, now - start, now - self.started))
+
+    @contextmanager
+    def track_imports(self):
+        original = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            start = time.perf_counter()
+            self._depth += 1
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                self._depth -= 1
+                self.imports.append((name, time.perf_counter() - start, self._depth))
+
+        builtins.__import__ = timed_import
+        try:
+            yield
+        finally:
+            builtins.__import__ = original
+
+    def slowest_imports(self, limit=15, max_depth=1):
+        imports = [i for i in self.imports if i[2] <= max_depth]
+        return sorted(imports, key=lambda i: i[1], reverse=True)[:limit]
+
+    def report(self):
+        lines = [f'{"fase":<28} {"ms":>9} {"acumulado":>10}']
+        for name, seconds, at in self.phases:
+            lines.append(f'{name:<28} {seconds * 1000:>9.1f} {at * 1000:>10.1f}')
+        slowest = self.slowest_imports()
+        if slowest:
+            lines += ['', f'{"import (inclusivo)":<28} {"ms":>9}']
+            for name, seconds, depth in slowest:
+                lines.append(f'{"  " * depth + name:<28} {seconds * 1000:>9.1f}')
+        return '\n'.join(lines)
@@ -1,13 +1,6 @@
-// Very small service worker for offline caching of basic assets (optional)
-const CACHE = 'fingest-v1';
-const urls = [
-  '/',
-  '/static/style.css',
-  '/static/default-avatar.svg',
-];
-self.addEventListener('install', (e) => {
-  e.waitUntil(caches.open(CACHE).then((c) => c.addAll(urls)));
-});
-self.addEventListener('fetch', (e) => {
-  e.respondWith(caches.match(e.request).then((r) => r || fetch(e.request)));
+// Replaced by the generated worker at /sw.js. Browsers that registered this
+// one (scope /static/) remove it and its cache on the next update check.
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', (event) => {
+  event.waitUntil(caches.delete('fingest-v1').then(() => self.registration.unregister()));
 });
@@ -0,0 +1,49 @@
+// Generated by app.py (/sw.js) from the asset manifest; served with no-cache.
+const VERSION = {{ version|tojson }};
+const ASSET_CACHE = 'fingest-assets-' + VERSION;
+const PAGE_CACHE = 'fingest-pages';
+const PRECACHE = {{ precache|tojson }};
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(caches.open(ASSET_CACHE).then((cache) => cache.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(caches.keys().then((keys) => Promise.all(
+    keys.filter((key) => key !== ASSET_CACHE && key !== PAGE_CACHE).map((key) => caches.delete(key))
+  )).then(() => self.clients.claim()));
+});
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+
+  // versioned URLs never change content: cache first
+  if (url.pathname.startsWith('/assets/') || url.pathname.startsWith('/avatars/')) {
+    event.respondWith(caches.match(request).then((hit) => hit || fetch(request).then((response) => {
+      if (response.ok) {
+        const copy = response.clone();
+        caches.open(ASSET_CACHE).then((cache) => cache.put(request, copy));
+      }
+      return response;
+    })));
+    return;
+  }
+
+  if (request.mode === 'navigate') {
+    if (url.pathname === '/logout') {
+      event.waitUntil(caches.delete(PAGE_CACHE));
+      return;
+    }
+    // pages depend on the session: always ask the server, use the last copy only when it is unreachable
+    event.respondWith(fetch(request).then((response) => {
+      if (response.ok && !response.redirected) {
+        const copy = response.clone();
+        caches.open(PAGE_CACHE).then((cache) => cache.put(request, copy));
+      }
+      return response;
+    }).catch(() => caches.match(request, {cacheName: PAGE_CACHE}).then((hit) => hit || Response.error())));
+  }
+});
@@ -0,0 +1,105 @@
+import random
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from aggregates import (monthly_totals, category_averages, user_total, rollup_add, rollup_remove, rebuild_rollup,
+                        bump_data_version, refresh_forecasts, stored_forecast, to_cents, global_monthly_totals,
+                        global_total, stats_add_user, stats_change_role, admin_stats_row, rebuild_admin_stats)
+from migrations import migrate
+from forecasting import forecast
+
+
+def _make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    migrate(conn)
+    rnd = random.Random(42)
+    rows = []
+    for _ in range(500):
+        rows.append((round(rnd.uniform(1, 300), 2), rnd.choice(['food', 'bills', 'coffee']),
+                     f'{rnd.choice([2023, 2024])}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+                     rnd.choice([1, 2])))
+    conn.executemany('INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (?, ?, ?, ?)',
+                     [(to_cents(r[0]),) + r[1:] for r in rows])
+    rebuild_rollup(conn)
+    return conn
+
+
+def test_sql_aggregates_match_pandas():
+    conn = _make_db()
+    df = pd.read_sql_query('SELECT amount, category, date FROM expenses WHERE user_id = 1', conn)
+    df['month'] = pd.to_datetime(df['date']).dt.to_period('M')
+    expected = df.groupby('month')['amount'].sum()
+
+    monthly = monthly_totals(conn, 1)
+    assert [m for m, _ in monthly] == expected.index.astype(str).tolist()
+    for (_, total), exp in zip(monthly, expected.tolist()):
+        assert abs(total - exp) < 1e-6
+
+    assert category_averages(conn, 1) == df.groupby('category')['amount'].mean().round(2).to_dict()
+    assert monthly_totals(conn, 99) == []
+
+
+def _rollup_rows(conn):
+    cur = conn.execute('SELECT user_id, month, category, total_cents, count FROM expense_monthly_rollup ORDER BY 1, 2, 3')
+    return [tuple(r) for r in cur]
+
+
+def test_incremental_rollup_matches_rebuild():
+    conn = _make_db()
+    rollup_add(conn, 1, '2025-01-10', 'food', 12.5)
+    conn.execute("INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (1250, 'food', '2025-01-10', 1)")
+
+    # edit moving an expense to another month and category
+    exp = conn.execute('SELECT * FROM expenses WHERE user_id = 1 ORDER BY id LIMIT 1').fetchone()
+    conn.execute("UPDATE expenses SET amount_cents = 4000, category = 'travel', date = '2025-02-01' WHERE id = ?", (exp['id'],))
+    rollup_remove(conn, 1, exp['date'], exp['category'], exp['amount'])
+    rollup_add(conn, 1, '2025-02-01', 'travel', 40)
+
+    # delete every expense of user 2
+    for exp in conn.execute('SELECT * FROM expenses WHERE user_id = 2').fetchall():
+        conn.execute('DELETE FROM expenses WHERE id = ?', (exp['id'],))
+        rollup_remove(conn, 2, exp['date'], exp['category'], exp['amount'])
+
+    incremental = _rollup_rows(conn), global_monthly_totals(conn)
+    rebuild_rollup(conn)
+    assert incremental == (_rollup_rows(conn), global_monthly_totals(conn))
+    assert user_total(conn, 2) == 0.0
+    assert monthly_totals(conn, 2) == []
+    # only user 1 is left, and 2025-01 has a single expense
+    assert {users for _, _, _, users in global_monthly_totals(conn)} == {1}
+    assert ('2025-01', 12.5, 1, 1) in global_monthly_totals(conn)
+    assert global_total(conn) == user_total(conn, 1)
+
+
+def test_refresh_forecasts_stores_versioned_predictions():
+    conn = _make_db()
+    bump_data_version(conn, 1)
+    assert refresh_forecasts(conn, model='linear') == 2
+    expected = round(forecast([t for _, t in monthly_totals(conn, 1)], model='linear'), 2)
+    assert stored_forecast(conn, 1, 1) == pytest.approx(expected)
+    # a newer data version invalidates the stored row
+    bump_data_version(conn, 1)
+    assert stored_forecast(conn, 1, 2) is None
+
+
+def test_admin_stats_row_tracks_users_roles_and_forecasts():
+    conn = _make_db()
+    assert admin_stats_row(conn) == (0, 0, 0.0, None)
+    for name, role in [('a', 'admin'), ('b', 'user'), ('c', 'user')]:
+        conn.execute('INSERT INTO users (username, role) VALUES (?, ?)', (name, role))
+        stats_add_user(conn, role)
+    stats_change_role(conn, 'user', 'admin')
+    stats_change_role(conn, 'admin', 'admin')
+    conn.execute("UPDATE users SET role = 'admin' WHERE username = 'b'")
+    refresh_forecasts(conn, model='linear')
+    users, admins, projected, forecast_at = admin_stats_row(conn)
+    assert (users, admins) == (3, 2) and forecast_at is not None
+    assert projected == pytest.approx(conn.execute('SELECT SUM(prediction) FROM forecasts').fetchone()[0])
+    # the incremental row matches a full recount
+    before = admin_stats_row(conn)
+    rebuild_admin_stats(conn)
+    after = admin_stats_row(conn)
+    assert after[:2] == before[:2] and after[2] == pytest.approx(before[2]) and after[3] == before[3]
@@ -1,5 +1,6 @@
 import os
 import tempfile
+import time
 import sqlite3
 import pytest
 
@@ -7,6 +8,8 @@ import pytest
 tmpfd, tmpdb = tempfile.mkstemp()
 os.close(tmpfd)
 os.environ['FINGEST_DB_PATH'] = tmpdb
+os.environ['FINGEST_EXPORTS_DIR'] = tempfile.mkdtemp()
+os.environ['FINGEST_AVATAR_DIR'] = tempfile.mkdtemp()
 
 from app import app, init_db
 
@@ -63,3 +66,439 @@ def test_register_login_add_edit_delete(client):
     rv = client.get('/api/summary')
     j = rv.get_json()
     assert j['total'] == 0.0
+
+
+def test_add_and_edit_validate_amount_and_date(client):
+    before = client.get('/api/summary').get_json()['total']
+    for amount in ('nan', 'inf', '1e300', 'abc'):
+        rv = client.post('/add_expense', data={'amount': amount, 'category': 'other'})
+        assert rv.status_code == 302 and rv.headers['Location'].endswith('/add_expense')
+    rv = client.post('/add_expense', data={'amount': '5', 'category': 'other', 'date': '31/02/2024'},
+                     follow_redirects=True)
+    assert 'Dados inválidos: data inválida'.encode() in rv.data
+    assert client.get('/api/summary').get_json()['total'] == before
+
+    client.post('/add_expense', data={'amount': '7,25', 'category': 'valid', 'date': '01/02/2024'})
+    conn = sqlite3.connect(tmpdb)
+    exp_id, stored = conn.execute("SELECT id, date FROM expenses WHERE category = 'valid'").fetchone()
+    assert stored == '2024-02-01'
+    for amount in ('nan', '-inf', '1e300'):
+        rv = client.post(f'/expense/{exp_id}/edit', data={'amount': amount, 'category': 'valid'})
+        assert rv.status_code == 302 and rv.headers['Location'].endswith(f'/expense/{exp_id}/edit')
+    client.post(f'/expense/{exp_id}/edit', data={'amount': '8', 'category': 'valid', 'date': '15/03/2024'})
+    assert conn.execute('SELECT date, amount_cents FROM expenses WHERE id = ?', (exp_id,)).fetchone() == ('2024-03-15', 800)
+    conn.close()
+    assert client.get('/api/summary').get_json()['total'] == round(before + 8, 2)
+    client.post(f'/expense/{exp_id}/delete')  # later tests count this user's rows
+
+
+def test_db_pool_reuses_wal_connections(client):
+    from app import db_pool
+    client.get('/login')
+    before = db_pool.stats()
+    for _ in range(3):
+        client.get('/api/summary')
+    after = db_pool.stats()
+    # requests borrow an idle connection instead of opening new ones
+    assert after['created'] == before['created']
+    assert after['reused'] >= before['reused'] + 3
+
+    conn = sqlite3.connect(tmpdb)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.close()
+
+
+def test_forecast_cache_hits_until_data_changes(client):
+    from app import forecast_cache
+    forecast_cache.clear()
+    hits, misses = forecast_cache.hits, forecast_cache.misses
+    client.get('/dashboard')
+    client.get('/dashboard')
+    assert (forecast_cache.hits - hits, forecast_cache.misses - misses) == (1, 1)
+
+    client.post('/add_expense', data={'amount': '20.00', 'category': 'food', 'date': '2024-01-05'})
+    client.get('/dashboard')
+    assert forecast_cache.misses - misses == 2
+
+
+def test_admin_reads_batch_forecasts(client):
+    from app import get_db, refresh_forecasts
+    with app.app_context():
+        assert refresh_forecasts(get_db()) >= 1
+    rv = client.get('/admin')
+    assert rv.status_code == 200
+    assert 'Previsão para o próximo mês'.encode() in rv.data
+
+
+def test_scheduler_jobs_run_on_demand(client):
+    from app import scheduler, rate_limiter
+    rate_limiter.hit('login:stale-ip', 5, 300, now=0.0)
+    rv = client.post('/admin/jobs/purge_rate_limits/run')
+    assert rv.status_code == 200 and rv.get_json()['ran'] is True
+    assert 'login:stale-ip' not in rate_limiter._entries
+
+    assert scheduler.run('refresh_forecasts') is True
+    assert scheduler.metrics['refresh_forecasts']['runs'] >= 1
+    stats = client.get('/admin/jobs').get_json()
+    assert stats['jobs']['refresh_forecasts']['last_duration'] is not None
+
+
+def test_scheduler_lease_is_single_instance():
+    from app import db_pool, scheduler
+    from scheduler import JobScheduler
+    other = JobScheduler(db_pool)
+    with db_pool.connection() as conn:
+        assert scheduler.acquire_lease(conn) is True
+        assert other.acquire_lease(conn) is False
+    scheduler.release_lease()
+    with db_pool.connection() as conn:
+        assert other.acquire_lease(conn) is True
+    other.release_lease()
+
+
+def test_scheduler_renews_lease_during_long_jobs_and_logs_failures(caplog):
+    from app import db_pool
+    from scheduler import JobScheduler
+    sched = JobScheduler(db_pool, lock_name='test-renew', lock_ttl=0.3)
+    other = JobScheduler(db_pool, lock_name='test-renew', lock_ttl=0.3)
+    seen = []
+
+    @sched.job('slow', 'interval', hours=1)
+    def slow(conn):
+        time.sleep(0.6)  # twice the TTL
+        with db_pool.connection() as c:
+            seen.append(other.acquire_lease(c))
+
+    @sched.job('broken', 'interval', hours=1)
+    def broken(conn):
+        raise RuntimeError('boom')
+
+    assert sched.run('slow') is True
+    assert seen == [False]
+    with caplog.at_level('ERROR', logger='scheduler'):
+        sched._run_logged('broken')
+    assert 'scheduled job broken failed' in caplog.text and 'boom' in caplog.text
+    sched.release_lease()
+
+
+def test_streaming_export_formats_and_filters(client):
+    import csv
+    import gzip
+    import io
+    from openpyxl import load_workbook
+
+    client.post('/add_expense', data={'amount': '7.25', 'category': 'coffee', 'date': '2024-03-02'})
+
+    rv = client.get('/export?format=csv')
+    assert rv.status_code == 200 and rv.is_streamed
+    assert rv.headers['Content-Type'] == 'text/csv; charset=utf-8'
+    rows = list(csv.reader(io.StringIO(rv.get_data(as_text=True))))
+    assert rows[0] == ['amount', 'category', 'date']
+    assert ['7.25', 'coffee', '2024-03-02'] in rows
+
+    rv = client.get('/export?format=csv.gz&start=2024-02-01&category=coffee')
+    rows = list(csv.reader(io.StringIO(gzip.decompress(rv.data).decode())))
+    assert rows[1:] == [['7.25', 'coffee', '2024-03-02']]
+
+    rv = client.get('/export')
+    ws = load_workbook(io.BytesIO(rv.data)).active
+    assert [c.value for c in ws[1]] == ['amount', 'category', 'date']
+    assert ws.max_row == 3  # header + both expenses of testuser
+
+    rv = client.get('/export?format=csv&start=2030-01-01')
+    assert rv.status_code == 302
+
+
+def test_async_export_job_dedup_and_download(client):
+    from app import export_jobs
+    rv = client.get('/export?mode=async&format=csv')
+    assert rv.status_code == 202
+    job = rv.get_json()
+    export_jobs.wait()
+
+    status = client.get(job['status_url']).get_json()
+    assert status['status'] == 'done'
+    rv = client.get(status['download_url'])
+    assert rv.status_code == 200
+    assert rv.headers['Content-Type'] == 'text/csv; charset=utf-8'
+    assert rv.data.startswith(b'amount,category,date')
+
+    # identical request reuses the finished artifact
+    again = client.get('/export?mode=async&format=csv').get_json()
+    assert again['id'] == job['id'] and again['status'] == 'done'
+
+    # new data -> new data version -> new job
+    client.post('/add_expense', data={'amount': '1.00', 'category': 'other', 'date': '2024-03-03'})
+    newer = client.get('/export?mode=async&format=csv').get_json()
+    assert newer['id'] != job['id']
+    export_jobs.wait()
+
+    # admin-wide export includes the user_id column
+    rv = client.get('/export?mode=async&format=csv&scope=all')
+    export_jobs.wait()
+    rv = client.get(client.get(rv.get_json()['status_url']).get_json()['download_url'])
+    assert rv.data.startswith(b'user_id,amount,category,date')
+
+    # retention: with no byte budget every artifact is evicted
+    export_jobs.max_bytes = 0
+    assert export_jobs.purge() >= 3
+    assert client.get(job['status_url']).status_code == 404
+    export_jobs.max_bytes = 512 * 1024 * 1024
+
+
+def test_export_job_left_running_by_dead_process_is_not_reused(client):
+    from app import export_jobs, get_db
+    rv = client.get('/export?mode=async&format=csv.gz')
+    job = rv.get_json()
+    export_jobs.wait()
+    with app.app_context():
+        conn = get_db()
+        # as if the worker building it had been killed an hour ago
+        conn.execute("UPDATE export_jobs SET status = 'running', created_at = created_at - 3600 WHERE id = ?",
+                     (job['id'],))
+        conn.commit()
+    status = client.get(job['status_url']).get_json()
+    assert status['status'] == 'failed' and 'interrompido' in status['error']
+    again = client.get('/export?mode=async&format=csv.gz').get_json()
+    assert again['id'] != job['id']
+    export_jobs.wait()
+    assert client.get(again['status_url']).get_json()['status'] == 'done'
+
+
+def test_bulk_import_endpoints(client):
+    import io
+    before = client.get('/api/summary').get_json()['total']
+    rv = client.post('/api/expenses/batch', json={'expenses': [
+        {'amount': 3, 'category': 'food', 'date': '2024-04-01'},
+        {'amount': 'oops', 'category': 'food'},
+    ]})
+    assert rv.get_json()['inserted'] == 1 and rv.get_json()['errors'][0]['line'] == 2
+
+    csv_data = b'amount,category,date\n2.00,coffee,2024-04-02\n,coffee,2024-04-02\n'
+    rv = client.post('/import', data={'file': (io.BytesIO(csv_data), 'extrato.csv')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 200
+    assert '1 gastos importados, 1 linhas com erro'.encode() in rv.data
+    assert client.get('/api/summary').get_json()['total'] == round(before + 5, 2)
+
+    # a cp1252 bank export with accented categories, then one with a broken field
+    csv_data = 'valor;categoria;data\n4,00;Alimentação;02/04/2024\n1,00;Café;03/04/2024\n'.encode('cp1252')
+    rv = client.post('/import', data={'file': (io.BytesIO(csv_data), 'banco.csv')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 200 and '2 gastos importados, 0 linhas com erro'.encode() in rv.data
+    categories = {e['category'] for e in client.get('/api/expenses?limit=100').get_json()['items']}
+    assert {'Alimentação', 'Café'} <= categories
+    csv_data = b'amount,category,date\n1.00,food,2024-04-03\n2.00,"' + b'x' * 200_000 + b'",2024-04-03\n'
+    rv = client.post('/import', data={'file': (io.BytesIO(csv_data), 'quebrado.csv')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 200
+    assert '1 gastos importados, 1 linhas com erro'.encode() in rv.data and 'arquivo inválido'.encode() in rv.data
+
+
+def test_expense_listing_api_and_page(client):
+    rv = client.get('/api/expenses?limit=2')
+    page = rv.get_json()
+    assert len(page['items']) == 2 and page['next_cursor']
+    rest = client.get(f'/api/expenses?limit=100&cursor={page["next_cursor"]}').get_json()
+    ids = [e['id'] for e in page['items'] + rest['items']]
+    assert len(ids) == len(set(ids)) and rest['next_cursor'] is None
+    assert client.get('/api/expenses?cursor=bad').status_code == 400
+    rv = client.get('/expenses?category=coffee')
+    assert rv.status_code == 200 and b'coffee' in rv.data
+
+
+def test_current_user_cached_and_invalidated_by_profile(client):
+    from app import user_cache
+    user_cache.clear()
+    misses = user_cache.misses
+    client.get('/api/summary')
+    client.get('/api/summary')
+    assert user_cache.misses - misses == 1
+
+    client.post('/profile', data={'email': 'new@test.local'})
+    rv = client.get('/profile')
+    assert b'new@test.local' in rv.data
+    stats = client.get('/admin/cache_stats').get_json()
+    assert stats['users']['hits'] >= 1
+
+
+def test_login_rehashes_when_cost_changes(client):
+    from app import password_hasher
+    old_iterations = password_hasher.iterations
+    password_hasher.iterations = 1000
+    try:
+        client.post('/login', data={'username': 'testuser', 'password': 'TestPass123'})
+        conn = sqlite3.connect(tmpdb)
+        stored = conn.execute("SELECT password FROM users WHERE username = 'testuser'").fetchone()[0]
+        conn.close()
+        assert stored.startswith('pbkdf2:sha256:1000$')
+        rv = client.post('/login', data={'username': 'testuser', 'password': 'TestPass123'}, follow_redirects=True)
+        assert b'Bem-vindo' in rv.data
+    finally:
+        password_hasher.iterations = old_iterations
+
+
+def test_busy_hasher_returns_503(client, monkeypatch):
+    from app import password_hasher
+    from hashing import HasherBusy
+
+    def busy(*args):
+        raise HasherBusy()
+    monkeypatch.setattr(password_hasher, 'verify', busy)
+    rv = client.post('/login', data={'username': 'testuser', 'password': 'x'})
+    assert rv.status_code == 503 and rv.headers['Retry-After']
+
+
+def test_metrics_and_server_timing(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'SERVER_TIMING', True)
+    rv = client.get('/dashboard')
+    assert rv.status_code == 200
+    timing = rv.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'sql;dur=' in timing and 'render;dur=' in timing and 'forecast;dur=' in timing
+
+    rv = client.get('/metrics')
+    assert rv.status_code == 200
+    body = rv.get_data(as_text=True)
+    assert 'fingest_request_duration_seconds_count{endpoint="dashboard",method="GET"}' in body
+    assert 'fingest_span_duration_seconds_bucket{span="render",endpoint="dashboard",le="+Inf"}' in body
+    assert 'fingest_sql_queries_total ' in body
+
+    anon = app.test_client()
+    assert anon.get('/metrics').status_code == 403
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 'scrape-me')
+    assert anon.get('/metrics', headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
+
+
+def test_avatar_upload_serves_immutable_thumbnails(client):
+    import io
+    import app as app_module
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (900, 900), 'purple').save(buf, 'PNG')
+    rv = client.post('/profile', data={'photo': (io.BytesIO(buf.getvalue()), 'me.png')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 200
+    app_module.avatar_store.wait()
+
+    html = client.get('/dashboard').get_data(as_text=True)
+    import re
+    m = re.search(r'src="(/avatars/[0-9a-f]{32}-64\.webp)"', html)
+    assert m
+    rv = client.get(m.group(1))
+    assert rv.status_code == 200
+    assert rv.mimetype == 'image/webp'
+    assert 'immutable' in rv.headers['Cache-Control'] and 'max-age=31536000' in rv.headers['Cache-Control']
+
+    rv = client.post('/profile', data={'photo': (io.BytesIO(b'garbage'), 'x.png')},
+                     content_type='multipart/form-data')
+    assert 'Foto não atualizada' in rv.get_data(as_text=True)
+
+
+def test_fingerprinted_assets_and_service_worker(client):
+    import re
+    html = client.get('/dashboard').get_data(as_text=True)
+    assert 'cdn.jsdelivr.net' not in html
+    css = re.search(r'href="(/assets/style\.[0-9a-f]{12}\.css)"', html).group(1)
+    assert re.search(r'src="/assets/vendor/chart\.umd\.min\.[0-9a-f]{12}\.js"', html)
+
+    rv = client.get(css)
+    assert rv.status_code == 200
+    assert 'immutable' in rv.headers['Cache-Control'] and 'max-age=31536000' in rv.headers['Cache-Control']
+    rv = client.get('/assets/style.000000000000.css')
+    assert rv.status_code == 200 and 'no-cache' in rv.headers['Cache-Control']
+    assert client.get('/assets/nothere.000000000000.css').status_code == 404
+
+    rv = client.get('/sw.js')
+    assert rv.status_code == 200 and 'no-cache' in rv.headers['Cache-Control']
+    body = rv.get_data(as_text=True)
+    assert f'"{css}"' in body and '"/"' not in body
+    assert client.get('/sw.js', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+
+def test_conditional_get_uses_data_version(client):
+    rv = client.get('/api/summary')
+    assert rv.status_code == 200
+    etag = rv.headers['ETag']
+    assert not etag.startswith('W/') and 'no-cache' in rv.headers['Cache-Control']
+    rv = client.get('/api/summary', headers={'If-None-Match': etag})
+    assert rv.status_code == 304 and rv.data == b''
+
+    page = client.get('/dashboard')
+    page_etag = page.headers['ETag']
+    assert client.get('/dashboard', headers={'If-None-Match': page_etag}).status_code == 304
+
+    # settings change the limit shown by both
+    client.post('/settings', data={'monthly_limit': '1234'})
+    rv = client.get('/api/summary', headers={'If-None-Match': etag})
+    assert rv.status_code == 200 and rv.get_json()['limit'] == 1234.0
+    etag = rv.headers['ETag']
+    rv = client.get('/dashboard', headers={'If-None-Match': page_etag})
+    assert rv.status_code == 200
+    page_etag = rv.headers['ETag']
+    assert client.get('/dashboard', headers={'If-None-Match': page_etag}).status_code == 304
+
+    # add_expense redirects with a flash: that page is rendered and not reusable
+    client.post('/add_expense', data={'amount': '1.00', 'category': 'other'})
+    assert client.get('/api/summary', headers={'If-None-Match': etag}).status_code == 200
+    rv = client.get('/dashboard', headers={'If-None-Match': page_etag})
+    assert rv.status_code == 200 and 'Gasto adicionado' in rv.get_data(as_text=True)
+    assert 'ETag' not in rv.headers
+    assert client.get('/dashboard', headers={'If-None-Match': page_etag}).status_code == 200
+
+
+def test_compressed_dashboard_revalidates_with_weak_etag(client):
+    import gzip
+    rv = client.get('/dashboard', headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert b'</html>' in gzip.decompress(rv.data)
+    etag = rv.headers['ETag']
+    assert etag.startswith('W/')
+    rv = client.get('/dashboard', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert rv.status_code == 304 and rv.headers['ETag'] == etag
+
+    rv = client.get('/export?format=csv', headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(rv.data).startswith(b'amount,category,date')
+
+
+def test_admin_panel_pages_users_and_caches_stats(client):
+    import app as app_module
+    rv = client.get('/api/admin/users?limit=1')
+    assert rv.status_code == 200
+    body = rv.get_json()
+    assert len(body['items']) == 1 and body['items'][0]['role'] == 'admin'
+    assert 'password' not in body['items'][0]
+    assert client.get('/api/admin/users?cursor=x').status_code == 400
+
+    app_module.admin_stats_cache.clear()
+    stats = client.get('/api/admin/stats').get_json()
+    assert stats['total_users'] >= 1 and stats['total_spent'] > 0
+    assert stats['months'][-1]['active_users'] >= 1
+    # cached: a new expense shows up once the TTL expires (or on register/role change)
+    client.post('/add_expense', data={'amount': '5.00', 'category': 'other'})
+    assert client.get('/api/admin/stats').get_json()['total_spent'] == stats['total_spent']
+    app_module.admin_stats_cache.clear()
+    assert client.get('/api/admin/stats').get_json()['total_spent'] == round(stats['total_spent'] + 5, 2)
+
+    html = client.get('/admin?role=admin').get_data(as_text=True)
+    assert 'Usuários ativos' in html and 'btn-admin-setrole' in html
+    import re
+    assert len(set(re.findall(r'data-csrf="([^"]+)"', html))) == 1  # one token for the whole page
+
+
+def test_admin_stats_follow_register_and_role_changes(client):
+    import app as app_module
+    app_module.admin_stats_cache.clear()
+    before = client.get('/api/admin/stats').get_json()
+    client.post('/register', data={'username': 'statsuser', 'password': 'StatsPass123'})
+    with app.app_context():
+        target = app_module.get_db().execute("SELECT id FROM users WHERE username = 'statsuser'").fetchone()['id']
+    stats = client.get('/api/admin/stats').get_json()
+    assert (stats['total_users'], stats['admins']) == (before['total_users'] + 1, before['admins'])
+    for role in ('admin', 'admin'):  # repeating a role change is not counted twice
+        client.post('/admin/set_role', data={'user_id': target, 'role': role})
+    assert client.get('/api/admin/stats').get_json()['admins'] == before['admins'] + 1
+    client.post('/admin/set_role', data={'user_id': target, 'role': 'user'})
+    assert client.get('/api/admin/stats').get_json()['admins'] == before['admins']
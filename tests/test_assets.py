@@ -0,0 +1,34 @@
+import os
+import time
+
+from assets import AssetManifest, hashed_name, split_hashed
+
+
+def test_hashed_names_round_trip():
+    assert hashed_name('vendor/app.min.js', 'abcdef012345') == 'vendor/app.min.abcdef012345.js'
+    assert split_hashed('vendor/app.min.abcdef012345.js') == ('vendor/app.min.js', 'abcdef012345')
+    assert split_hashed('style.css') == ('style.css', None)
+    assert split_hashed('style.nothex000000.css') == ('style.nothex000000.css', None)
+
+
+def test_manifest_skips_uploads_and_tracks_changes(tmp_path):
+    (tmp_path / 'style.css').write_text('body{}')
+    (tmp_path / 'sw.js').write_text('// legacy')
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'me.png').write_bytes(b'x')
+    (tmp_path / 'vendor').mkdir()
+    (tmp_path / 'vendor' / 'lib.js').write_text('1')
+
+    manifest = AssetManifest(str(tmp_path))
+    assert manifest.names() == ['style.css', 'vendor/lib.js']
+    assert manifest.hashed('missing.css') is None
+    first, version = manifest.hashed('style.css'), manifest.version()
+
+    path = tmp_path / 'style.css'
+    path.write_text('body{color:red}')
+    later = time.time() + 5
+    os.utime(path, (later, later))
+    assert manifest.hashed('style.css') == first  # fixed until rescanned
+    manifest.auto_reload = True
+    assert manifest.hashed('style.css') != first
+    assert manifest.version() != version
@@ -0,0 +1,89 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import avatars
+from db import ConnectionPool
+from migrations import migrate
+
+
+def _jpeg(color, size=(1200, 800)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'JPEG', quality=95)
+    return out.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'db.sqlite'))
+    with pool.connection() as conn:
+        migrate(conn)
+        conn.execute("INSERT INTO users (id, username, photo) VALUES (1, 'a', 'user_1.png'), (2, 'b', NULL)")
+        conn.commit()
+    (tmp_path / 'user_1.png').write_bytes(b'legacy')
+    changed = []
+    s = avatars.AvatarStore(pool, str(tmp_path / 'avatars'), workers=0, on_change=changed.append,
+                            legacy_dir=str(tmp_path))
+    s.changed = changed
+    return s
+
+
+def _photo(store, user_id):
+    with store.pool.connection() as conn:
+        return conn.execute('SELECT photo FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+
+
+def test_thumbnails_are_small_square_webp():
+    data = _jpeg('red')
+    thumbs = avatars.make_thumbnails(data)
+    assert sorted(thumbs) == list(avatars.SIZES)
+    for size, body in thumbs.items():
+        image = Image.open(io.BytesIO(body))
+        assert image.format == 'WEBP'
+        assert image.size == (size, size)
+        assert len(body) < len(data) / 10
+
+
+def test_submit_replaces_and_cleans_up_superseded_files(store, tmp_path):
+    first = store.submit(1, _jpeg('red'))
+    assert _photo(store, 1) == first
+    assert store.changed == [1]
+    assert not (tmp_path / 'user_1.png').exists()  # legacy upload removed
+    for size in avatars.SIZES:
+        assert os.path.exists(store.path(avatars.filename(first, size)))
+
+    # user 2 uploads the same picture: files are shared, not duplicated
+    assert store.submit(2, _jpeg('red')) == first
+    second = store.submit(1, _jpeg('blue'))
+    assert second != first
+    assert os.path.exists(store.path(avatars.filename(first, 64)))  # still used by user 2
+
+    store.submit(2, _jpeg('green'))
+    assert not os.path.exists(store.path(avatars.filename(first, 64)))
+
+
+def test_stale_job_does_not_overwrite_newer_upload(store):
+    old, new = _jpeg('red'), _jpeg('blue')
+    store._latest[1] = avatars.avatar_key(new)
+    store._process(1, avatars.avatar_key(old), old)
+    assert _photo(store, 1) == 'user_1.png'
+
+
+def test_invalid_upload_and_orphan_purge(store):
+    with pytest.raises(ValueError):
+        store.submit(1, b'not an image')
+    key = store.submit(1, _jpeg('red'))
+    os.makedirs(store.directory, exist_ok=True)
+    orphan = store.path(avatars.filename('0' * 32, 64))
+    open(orphan, 'wb').close()
+    assert store.purge_orphans() == 1
+    assert not os.path.exists(orphan)
+    assert os.path.exists(store.path(avatars.filename(key, 64)))
+
+
+def test_pick_size():
+    assert avatars.pick_size(40) == 64
+    assert avatars.pick_size(120) == 256
+    assert avatars.pick_size(1000) == 256
@@ -0,0 +1,24 @@
+import time
+
+from cache import LRUCache
+
+
+def test_lru_eviction_and_stats():
+    c = LRUCache(maxsize=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a') == 1      # 'a' becomes most recent
+    c.set('c', 3)               # evicts 'b'
+    assert c.get('b') is None
+    assert c.get('c') == 3
+    stats = c.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (2, 1, 1, 2)
+
+
+def test_ttl_expiry():
+    c = LRUCache(maxsize=4, ttl=0.01)
+    c.set('k', 'v')
+    assert c.get('k') == 'v'
+    time.sleep(0.02)
+    assert c.get('k') is None
+    assert len(c) == 0
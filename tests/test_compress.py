@@ -0,0 +1,114 @@
+import gzip
+
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from compress import CompressionMiddleware, negotiate, parse_levels
+
+BODY = b'<p>' + b'fingest ' * 200 + b'</p>'
+
+
+def make_client(response_factory, **kwargs):
+    calls = {'closed': 0}
+
+    def app(environ, start_response):
+        response = response_factory()
+        response.call_on_close(lambda: calls.__setitem__('closed', calls['closed'] + 1))
+        return response(environ, start_response)
+
+    return Client(CompressionMiddleware(app, **kwargs)), calls
+
+
+def test_negotiate_respects_quality_and_preference():
+    assert negotiate('gzip, br', ['br', 'gzip']) == 'br'
+    assert negotiate('gzip;q=1, br;q=0.5', ['br', 'gzip']) == 'gzip'
+    assert negotiate('br;q=0, *', ['br', 'gzip']) == 'gzip'
+    assert negotiate('identity', ['br', 'gzip']) is None
+    assert negotiate('', ['gzip']) is None
+    assert parse_levels('gzip=9, br=5') == {'gzip': 9, 'br': 5}
+
+
+def test_gzip_html_and_weak_etag():
+    client, calls = make_client(lambda: Response(BODY, mimetype='text/html', headers={'ETag': '"abc"'}),
+                                encodings=['gzip'])
+    rv = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert rv.headers['Vary'] == 'Accept-Encoding'
+    assert rv.headers['ETag'] == 'W/"abc"'
+    assert 'Content-Length' not in rv.headers
+    assert gzip.decompress(rv.data) == BODY
+    rv.close()
+    assert calls['closed'] == 1
+
+    rv = client.get('/')
+    assert 'Content-Encoding' not in rv.headers and rv.data == BODY
+    assert rv.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_skips_small_unlisted_and_partial_responses():
+    client, _ = make_client(lambda: Response(b'{}', mimetype='application/json'))
+    assert 'Content-Encoding' not in client.get('/', headers={'Accept-Encoding': 'gzip'}).headers
+    client, _ = make_client(lambda: Response(BODY, mimetype='image/png'))
+    rv = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in rv.headers and 'Vary' not in rv.headers
+    client, _ = make_client(lambda: Response(BODY, mimetype='text/html', headers={'Cache-Control': 'no-transform'}))
+    assert 'Content-Encoding' not in client.get('/', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_compressed_file_drops_ranges_and_resume_gets_full_body(tmp_path):
+    from werkzeug.utils import send_file
+    path = tmp_path / 'app.css'
+    path.write_bytes(b'body { color: red }\n' * 200)
+
+    def app(environ, start_response):
+        return send_file(str(path), environ, mimetype='text/css', conditional=True)(environ, start_response)
+
+    client = Client(CompressionMiddleware(app, encodings=['gzip']))
+    rv = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Ranges' not in rv.headers and 'Last-Modified' not in rv.headers
+    etag = rv.headers['ETag']
+    assert etag.startswith('W/')
+
+    rv = client.get('/', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=100-', 'If-Range': etag})
+    assert rv.status_code == 200 and rv.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(rv.data) == path.read_bytes()
+    # an identity client can still use ranges
+    rv = client.get('/', headers={'Range': 'bytes=100-'})
+    assert rv.status_code == 206 and rv.data == path.read_bytes()[100:]
+
+
+def test_streams_generators_chunk_by_chunk():
+    produced = []
+    finished = []
+
+    def rows():
+        for i in range(50):
+            produced.append(i)
+            yield ('%d,' % i + 'x' * 2000 + '\n').encode()
+
+    client, calls = make_client(lambda: Response(rows(), mimetype='text/csv'), encodings=['gzip'],
+                                on_finish=lambda *args: finished.append(args))
+    rv = client.get('/', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    first = next(iter(rv.response))
+    assert first and len(produced) < 50  # output starts before the generator is exhausted
+    body = first + b''.join(rv.response)
+    rv.close()
+    text = gzip.decompress(body).decode()
+    assert text.count('\n') == 50
+    encoding, raw, out, seconds = finished[0]
+    assert (encoding, raw, out) == ('gzip', len(text), len(body)) and seconds >= 0
+    assert calls['closed'] == 1
+
+
+@pytest.mark.parametrize('encoding', ['br', 'zstd'])
+def test_optional_encodings(encoding):
+    module = pytest.importorskip({'br': 'brotli', 'zstd': 'zstandard'}[encoding])
+    client, _ = make_client(lambda: Response(BODY, mimetype='text/html'))
+    rv = client.get('/', headers={'Accept-Encoding': f'gzip;q=0.5, {encoding}'})
+    assert rv.headers['Content-Encoding'] == encoding
+    if encoding == 'br':
+        assert module.decompress(rv.data) == BODY
+    else:
+        assert module.ZstdDecompressor().decompressobj().decompress(rv.data) == BODY
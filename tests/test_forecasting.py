@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from forecasting import forecast, linear_trend, seasonal_naive, exponential_smoothing
+
+
+def test_linear_matches_sklearn():
+    sklearn_lm = pytest.importorskip('sklearn.linear_model')
+    rnd = random.Random(7)
+    for n in (2, 3, 12, 60):
+        values = [rnd.uniform(50, 2000) for _ in range(n)]
+        model = sklearn_lm.LinearRegression().fit([[i] for i in range(n)], values)
+        expected = float(model.predict([[n]])[0])
+        assert linear_trend(values) == pytest.approx(expected, rel=1e-9, abs=1e-9)
+
+
+def test_single_month_and_empty_series():
+    assert forecast([42.0]) == 42.0
+    assert forecast([]) == 0.0
+
+
+def test_optional_models():
+    series = list(range(1, 25))
+    assert seasonal_naive(series) == 13
+    assert seasonal_naive([5, 6]) == 6
+    assert exponential_smoothing([10, 20], alpha=0.5) == 15
+    assert forecast(series, model='seasonal_naive', season=6) == 19
+    with pytest.raises(ValueError):
+        forecast(series, model='nope')
+
+
+def test_batch_matches_per_series():
+    pytest.importorskip('numpy')
+    from forecasting import linear_trend_batch
+    rnd = random.Random(3)
+    series = [[rnd.uniform(0, 500) for _ in range(rnd.randint(1, 30))] for _ in range(200)] + [[]]
+    batch = linear_trend_batch(series)
+    for values, pred in zip(series, batch):
+        assert pred == pytest.approx(forecast(values, model='linear'), rel=1e-9, abs=1e-6)
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from hashing import HasherBusy, PasswordHasher
+
+
+def test_hash_verify_and_rehash_detection():
+    hasher = PasswordHasher(workers=1, iterations=1000, executor='thread')
+    pwhash = hasher.hash('s3cret')
+    assert pwhash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(pwhash, 's3cret') and not hasher.verify(pwhash, 'wrong')
+    assert not hasher.needs_rehash(pwhash)
+    hasher.iterations = 2000
+    assert hasher.needs_rehash(pwhash)
+    assert hasher.stats()['calls'] == 3
+    hasher.shutdown()
+
+
+def test_process_pool_backend():
+    hasher = PasswordHasher(workers=1, iterations=1000)
+    assert hasher.verify(hasher.hash('pw'), 'pw')
+    hasher.shutdown()
+
+
+def test_rejects_when_saturated():
+    hasher = PasswordHasher(workers=0, max_pending=1, iterations=1000)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(*args):
+        started.set()
+        release.wait(5)
+        return True
+
+    t = threading.Thread(target=hasher._run, args=(slow,))
+    t.start()
+    started.wait(5)
+    with pytest.raises(HasherBusy):
+        hasher.hash('pw')
+    release.set()
+    t.join()
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.hash('pw')  # slot freed again
+
+
+def test_timeout_is_reported_as_busy_and_keeps_the_slot():
+    hasher = PasswordHasher(workers=1, max_pending=1, iterations=1000, executor='thread', timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(HasherBusy):
+        hasher._run(release.wait, 5)
+    assert hasher.timeouts == 1
+    # the timed-out call is still running, so its slot is still taken
+    assert hasher.stats()['pending'] == 1
+    with pytest.raises(HasherBusy):
+        hasher.hash('pw')
+    assert hasher.rejected == 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while hasher.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert hasher.hash('pw')  # freed once the call actually returned
+    hasher.shutdown()
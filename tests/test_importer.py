@@ -0,0 +1,67 @@
+import io
+import sqlite3
+
+from aggregates import data_version, monthly_totals, rebuild_rollup
+from importer import import_records, iter_csv_records
+from migrations import migrate
+
+
+def _make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    migrate(conn)
+    return conn
+
+
+def test_csv_import_batches_and_reports_row_errors():
+    lines = ['valor;categoria;data']
+    for i in range(1, 1201):
+        lines.append(f'{i},50;food;{(i % 28) + 1:02d}/0{(i % 3) + 1}/2024')
+    lines.insert(10, 'abc;food;2024-01-01')
+    lines.insert(20, '5;;2024-01-01')
+    lines.insert(30, '5;food;2024-13-40')
+    conn = _make_db()
+
+    result = import_records(conn, 7, iter_csv_records(io.BytesIO('\n'.join(lines).encode())), batch_size=500)
+
+    assert result.inserted == 1200
+    assert [e['line'] for e in result.errors] == [11, 21, 31]
+    assert conn.execute('SELECT COUNT(*) FROM expenses WHERE user_id = 7').fetchone()[0] == 1200
+    # rollup updated once per batch, consistent with a full rebuild
+    incremental = monthly_totals(conn, 7)
+    rebuild_rollup(conn)
+    assert incremental == monthly_totals(conn, 7)
+    assert data_version(conn, 7) == 3  # three batches
+
+
+def test_json_records_import():
+    conn = _make_db()
+    records = enumerate([{'amount': 10, 'category': 'bills', 'date': '2024-05-01'}, {'amount': 'x'}], 1)
+    result = import_records(conn, 1, records).as_dict()
+    assert result['inserted'] == 1 and result['error_count'] == 1
+    assert result['errors'][0]['line'] == 2
+
+
+def test_non_finite_and_huge_amounts_are_row_errors():
+    csv_text = 'amount,category,date\n10,food,2024-01-01\nnan,food,2024-01-02\ninf,food,2024-01-03\n' \
+               '-inf,food,2024-01-03\n1e300,food,2024-01-04\n2.5,food,2024-01-05\n'
+    conn = _make_db()
+    result = import_records(conn, 3, iter_csv_records(io.BytesIO(csv_text.encode())))
+    assert result.inserted == 2
+    assert [e['line'] for e in result.errors] == [3, 4, 5, 6]
+    assert all('fora do intervalo' in e['error'] for e in result.errors)
+    assert monthly_totals(conn, 3) == [('2024-01', 12.5)]
+
+
+def test_cp1252_and_unreadable_csv():
+    conn = _make_db()
+    data = 'categoria,valor\nAlimentação,4\nCafé,1\n'.encode('cp1252')
+    result = import_records(conn, 4, iter_csv_records(io.BytesIO(data)))
+    assert result.inserted == 2 and result.error_count == 0
+    assert {r[0] for r in conn.execute('SELECT category FROM expenses WHERE user_id = 4')} == {'Alimentação', 'Café'}
+
+    # a field over csv.field_size_limit() stops the read; earlier rows are kept and reported
+    data = b'amount,category\n1,food\n2,"' + b'x' * 200_000 + b'"\n3,food\n'
+    result = import_records(conn, 5, iter_csv_records(io.BytesIO(data)))
+    assert result.inserted == 1
+    assert result.errors[0]['line'] == 3 and 'arquivo inválido' in result.errors[0]['error']
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from listing import list_expenses, list_users, decode_cursor
+from migrations import migrate
+
+
+def _make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    migrate(conn)
+    rows = [((i % 50) * 100, 'food' if i % 2 else 'bills', f'2024-{(i % 12) + 1:02d}-01', 1) for i in range(1000)]
+    conn.executemany('INSERT INTO expenses (amount_cents, category, date, user_id) VALUES (?, ?, ?, ?)', rows)
+    return conn
+
+
+def test_keyset_pages_cover_every_row_once_in_order():
+    conn = _make_db()
+    seen, cursor = [], None
+    while True:
+        rows, cursor = list_expenses(conn, 1, limit=64, cursor=cursor, category='food', min_amount=10)
+        seen.extend((r['date'], r['id']) for r in rows)
+        if not cursor:
+            break
+    expected = conn.execute("SELECT date, id FROM expenses WHERE category = 'food' AND amount >= 10 "
+                            'ORDER BY date DESC, id DESC').fetchall()
+    assert seen == [tuple(r) for r in expected]
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_user_pages_filter_by_role_and_name():
+    conn = _make_db()
+    conn.executemany('INSERT INTO users (username, role) VALUES (?, ?)',
+                     [(f'user{i:03d}' if i % 10 else f'adm_{i}', 'admin' if i % 10 == 0 else 'user')
+                      for i in range(1, 201)])
+    conn.execute("INSERT INTO forecasts VALUES (3, 42.0, 6, 'linear', 1, '2024-01-01')")
+    seen, cursor = [], None
+    while True:
+        rows, cursor = list_users(conn, limit=7, cursor=cursor, role='user')
+        seen.extend(r['id'] for r in rows)
+        if not cursor:
+            break
+    assert seen == [i for i in range(1, 201) if i % 10]
+    rows, _ = list_users(conn, limit=5)
+    assert rows[2]['prediction'] == 42.0 and rows[0]['prediction'] is None
+
+    rows, cursor = list_users(conn, q='user01')
+    assert [r['username'] for r in rows] == [f'user{i:03d}' for i in range(11, 20)] and cursor is None
+    # LIKE wildcards in the search are literal
+    assert [r['username'] for r in list_users(conn, q='adm_')[0]] == [f'adm_{i}' for i in range(10, 201, 10)]
+    assert list_users(conn, q='%')[0] == []
+    with pytest.raises(ValueError):
+        list_users(conn, cursor='x')
@@ -0,0 +1,62 @@
+import sqlite3
+
+import metrics
+
+
+def test_histogram_render_is_cumulative():
+    h = metrics.Histogram('t_seconds', 'test', (0.1, 1.0), ('endpoint',))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        h.observe(value, 'x')
+    lines = h.render()
+    assert 't_seconds_bucket{endpoint="x",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{endpoint="x",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{endpoint="x",le="+Inf"} 4' in lines
+    assert 't_seconds_count{endpoint="x"} 4' in lines
+    assert 't_seconds_sum{endpoint="x"} 4.05' in lines
+
+
+def test_label_values_are_escaped():
+    c = metrics.Counter('t_total', 'test', ('path',))
+    c.inc(2, 'a"b\\c')
+    assert c.render()[-1] == 't_total{path="a\\"b\\\\c"} 2'
+
+
+def test_instrumented_connection_counts_per_request():
+    conn = sqlite3.connect(':memory:', factory=metrics.InstrumentedConnection)
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    timings = metrics.start_request()
+    conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(10)])
+    cur = conn.cursor()
+    cur.execute('SELECT SUM(x) FROM t')
+    assert cur.fetchone()[0] == 45
+    with metrics.span('forecast'):
+        pass
+    assert metrics.finish_request('test_endpoint', 'GET', 200) is timings
+    assert timings.sql_count == 2
+    assert timings.sql_seconds > 0
+    assert 'forecast' in timings.spans
+    assert metrics.REQUEST_SQL_QUERIES.count('test_endpoint') == 1
+    # outside a request only the global counters move
+    assert metrics.current() is None
+    before = metrics.SQL_QUERIES.value()
+    conn.execute('SELECT 1')
+    assert metrics.SQL_QUERIES.value() == before + 1
+
+
+def test_iterated_rows_are_timed():
+    conn = sqlite3.connect(':memory:', factory=metrics.InstrumentedConnection)
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(1000)])
+    timings = metrics.start_request()
+    cur = conn.execute('SELECT x FROM t')
+    after_execute = timings.sql_seconds
+    assert sum(row[0] for row in cur) == 499500
+    assert timings.sql_seconds > after_execute
+    # a loop that stops early reports the rest on close()
+    cur = conn.execute('SELECT x FROM t')
+    next(cur)
+    before_close = timings.sql_seconds
+    cur.close()
+    assert timings.sql_seconds > before_close
+    metrics.finish_request('test_iter', 'GET', 200)
+    assert timings.sql_count == 2
@@ -0,0 +1,71 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from aggregates import global_total, monthly_totals, user_total
+from migrations import migrate, current_version, latest_version
+
+LEGACY_ROWS = int(os.environ.get('FINGEST_MIGRATION_TEST_ROWS', 200_000))
+
+
+def _legacy_db(path, rows):
+    """Database as created by the pre-migration init_db() (user_version 0, REAL amounts)."""
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT, '
+                 'email TEXT, role TEXT, photo TEXT)')
+    conn.execute('CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, amount REAL, category TEXT, '
+                 'date TEXT, user_id INTEGER, FOREIGN KEY(user_id) REFERENCES users(id))')
+    conn.execute('CREATE TABLE settings (user_id INTEGER PRIMARY KEY, monthly_limit REAL)')
+    rnd = random.Random(1)
+    conn.executemany(
+        'INSERT INTO expenses (amount, category, date, user_id) VALUES (?, ?, ?, ?)',
+        ((round(rnd.uniform(0.01, 999), 2), rnd.choice(['food', 'bills', 'coffee']),
+          f'{rnd.randint(2015, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}', rnd.randint(1, 50))
+         for _ in range(rows)))
+    conn.execute("INSERT INTO expenses (amount, category, date, user_id) VALUES (0.29, 'food', '05/02/2024', 999)")
+    conn.execute("INSERT INTO expenses (amount, category, date, user_id) VALUES (0.1, 'food', '2024-02-07T10:30', 999)")
+    conn.commit()
+    return conn
+
+
+def test_migrates_large_legacy_database():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = _legacy_db(path, LEGACY_ROWS)
+        conn.row_factory = sqlite3.Row
+        before = conn.execute('SELECT COUNT(*), SUM(amount) FROM expenses').fetchone()
+
+        start = time.perf_counter()
+        applied = migrate(conn)
+        elapsed = time.perf_counter() - start
+        print(f'\nmigrated {LEGACY_ROWS} expenses in {elapsed:.2f}s:',
+              ', '.join(f'v{v} {s:.2f}s' for v, _, s in applied))
+
+        assert [v for v, _, _ in applied] == list(range(1, latest_version() + 1))
+        assert current_version(conn) == latest_version()
+        after = conn.execute('SELECT COUNT(*), SUM(amount_cents) FROM expenses').fetchone()
+        assert after[0] == before[0]
+        assert after[1] == round(before[1] * 100)
+        assert elapsed < 60
+
+        # dates normalized, rollup rebuilt in cents
+        assert [r[0] for r in conn.execute('SELECT date FROM expenses WHERE user_id = 999 ORDER BY id')] == \
+            ['2024-02-05', '2024-02-07']
+        assert monthly_totals(conn, 999) == [('2024-02', 0.39)]
+        assert user_total(conn, 999) == 0.39
+        assert global_total(conn) == after[1] / 100
+        assert conn.execute("SELECT active_users FROM global_monthly_rollup WHERE month = '2024-02'").fetchone()[0] \
+            == 1 + conn.execute("SELECT COUNT(DISTINCT user_id) FROM expenses WHERE date LIKE '2024-02%' "
+                                'AND user_id != 999').fetchone()[0]
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'idx_expenses_user_date', 'idx_expenses_user_category_date', 'idx_users_role'} <= indexes
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] == 1
+
+        # running again is a no-op
+        assert migrate(conn) == []
+        conn.close()
+    finally:
+        os.remove(path)
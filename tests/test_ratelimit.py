@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+from ratelimit import MemoryRateLimiter, SQLiteRateLimiter
+
+
+def test_memory_limiter_sliding_window():
+    rl = MemoryRateLimiter()
+    assert all(rl.hit('ip', 3, 60, now=100 + i) for i in range(3))
+    assert rl.hit('ip', 3, 60, now=110) is False
+    # halfway into the next window the previous 3 hits still weigh 1.5
+    assert rl.hit('ip', 3, 60, now=190) is True
+    assert rl.hit('ip', 3, 60, now=191) is True
+    assert rl.hit('ip', 3, 60, now=192) is False
+    assert rl.hit('ip', 3, 60, now=400) is True
+    assert rl.hit('other', 3, 60, now=110) is True
+
+
+def test_memory_limiter_bounded_and_purged():
+    rl = MemoryRateLimiter(max_keys=100)
+    for i in range(1000):
+        rl.hit(f'client-{i}', 5, 60, now=0)
+    assert len(rl) == 100 and rl.evictions == 900
+    rl.hit('fresh', 5, 60, now=200)  # evicts one more idle key
+    assert rl.purge(now=200) == 99
+    assert len(rl) == 1
+
+
+def test_sqlite_limiter_shared_between_instances():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        worker_a, worker_b = SQLiteRateLimiter(path), SQLiteRateLimiter(path)
+        assert worker_a.hit('ip', 2, 60, now=0)
+        assert worker_b.hit('ip', 2, 60, now=1)
+        assert worker_a.hit('ip', 2, 60, now=2) is False
+        assert worker_b.purge(now=500) == 1
+        worker_a.pool.close_all()
+        worker_b.pool.close_all()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -0,0 +1,39 @@
+import pytest
+
+import server
+
+
+def test_choose_server_explicit_and_unknown():
+    assert server.choose_server('waitress') == 'waitress'
+    assert server.choose_server('gunicorn') == 'gunicorn'
+    with pytest.raises(ValueError):
+        server.choose_server('uwsgi')
+
+
+def test_choose_server_auto_falls_back_to_waitress(monkeypatch):
+    monkeypatch.setattr(server.os, 'name', 'nt')
+    assert server.choose_server('auto') == 'waitress'
+
+
+def test_gunicorn_options_threads_and_hooks():
+    calls = []
+    opts = server.gunicorn_options('0.0.0.0', 8000, workers=3, threads=4, max_requests=1000,
+                                   on_worker_start=lambda: calls.append('start'),
+                                   on_worker_exit=lambda: calls.append('exit'))
+    assert opts['bind'] == '0.0.0.0:8000'
+    assert opts['worker_class'] == 'gthread'
+    assert opts['preload_app'] is True
+    assert opts['max_requests_jitter'] == 100
+    opts['post_fork'](None, None)
+    opts['worker_exit'](None, None)
+    assert calls == ['start', 'exit']
+
+    assert server.gunicorn_options('127.0.0.1', 8000, 2, 1)['worker_class'] == 'sync'
+
+
+def test_hash_pool_size_splits_cpus_and_pending_between_workers():
+    # default 2 * CPUs + 1 workers: hash inline, share the pending budget
+    assert server.hash_pool_size(17, 32, cpus=8) == (0, 1)
+    assert server.hash_pool_size(2, 32, cpus=8) == (4, 16)
+    assert server.hash_pool_size(3, 32, cpus=8) == (2, 10)
+    assert server.hash_pool_size(1, 32, cpus=16) == (4, 32)
@@ -0,0 +1,23 @@
+import sys
+
+from startup import StartupProfile
+
+
+def test_phases_and_first_time_imports(tmp_path, monkeypatch):
+    (tmp_path / 'fg_startup_outer.py').write_text('import fg_startup_inner\n')
+    (tmp_path / 'fg_startup_inner.py').write_text('import time\ntime.sleep(0.01)\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    profile = StartupProfile()
+    with profile.phase('import'), profile.track_imports():
+        import fg_startup_outer  # noqa: F401
+        import fg_startup_outer  # noqa: F401,F811  (cached: not recorded again)
+    assert [p[0] for p in profile.phases] == ['import']
+    names = {name: (seconds, depth) for name, seconds, depth in profile.imports}
+    assert names['fg_startup_inner'][1] == 1
+    assert names['fg_startup_outer'][1] == 0
+    assert names['fg_startup_outer'][0] >= names['fg_startup_inner'][0] >= 0.01
+    assert [i[0] for i in profile.slowest_imports(max_depth=0)] == ['fg_startup_outer']
+    assert 'fg_startup_inner' in profile.report()
+    for name in ('fg_startup_outer', 'fg_startup_inner'):
+        sys.modules.pop(name, None)